@@ -0,0 +1,27 @@
+-- Migration: Stored full-text search vector for repair procedures
+-- Created: October 16, 2026
+-- Purpose: Rank and match knowledge base searches on a precomputed, GIN-indexed tsvector
+--          instead of re-tokenising every procedure on every chat message
+-- Note: Adding a stored generated column rewrites repair_procedures under an exclusive lock
+
+BEGIN;
+
+-- Weighted search document: title (A), overview (B), description (C)
+ALTER TABLE repair_procedures
+ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+    setweight(to_tsvector('english', COALESCE(title, '')), 'A') ||
+    setweight(to_tsvector('english', COALESCE(overview, '')), 'B') ||
+    setweight(to_tsvector('english', COALESCE(description, '')), 'C')
+) STORED;
+
+-- Index for @@ matches on the search vector
+CREATE INDEX IF NOT EXISTS idx_procedures_search_vector ON repair_procedures USING GIN(search_vector);
+
+COMMENT ON COLUMN repair_procedures.search_vector IS 'Weighted full-text document (title A, overview B, description C) used by the NLU knowledge base search';
+
+COMMIT;
+
+-- Verify the migration
+SELECT column_name, data_type, is_generated
+FROM information_schema.columns
+WHERE table_name = 'repair_procedures' AND column_name = 'search_vector';
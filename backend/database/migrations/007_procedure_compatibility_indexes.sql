@@ -0,0 +1,18 @@
+-- Migration: Expression indexes for device compatibility filters
+-- Created: October 16, 2026
+-- Purpose: Let the knowledge base search filter procedures by brand and device type
+--          (device_compatibility->'brands' ? ..., device_compatibility->'types' ? ...)
+--          with index scans instead of sequential scans
+-- Note: CREATE INDEX blocks writes to repair_procedures while the indexes are built
+
+BEGIN;
+
+CREATE INDEX IF NOT EXISTS idx_procedures_compat_brands ON repair_procedures USING GIN((device_compatibility->'brands'));
+CREATE INDEX IF NOT EXISTS idx_procedures_compat_types ON repair_procedures USING GIN((device_compatibility->'types'));
+
+COMMIT;
+
+-- Verify the migration
+SELECT indexname, indexdef
+FROM pg_indexes
+WHERE tablename = 'repair_procedures' AND indexname IN ('idx_procedures_compat_brands', 'idx_procedures_compat_types');
@@ -0,0 +1,70 @@
+-- Migration: Change notifications for the published procedure catalogue
+-- Created: October 16, 2026
+-- Purpose: NOTIFY repair_procedures_changed with the procedure id whenever a procedure,
+--          one of its steps or one of its feedback rows changes, so NLU workers holding
+--          an in-memory snapshot of the catalogue reload just that procedure
+-- Note: Notifications are delivered on commit; a TRUNCATE sends '*' (reload everything)
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION notify_repair_procedure_change()
+RETURNS TRIGGER AS $$
+DECLARE
+    id_column TEXT := TG_ARGV[0];
+    old_id TEXT;
+    new_id TEXT;
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        PERFORM pg_notify('repair_procedures_changed', '*');
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        old_id := to_jsonb(OLD)->>id_column;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        new_id := to_jsonb(NEW)->>id_column;
+    END IF;
+
+    -- Identical notifications in one transaction are delivered once
+    IF old_id IS NOT NULL THEN
+        PERFORM pg_notify('repair_procedures_changed', old_id);
+    END IF;
+    IF new_id IS NOT NULL THEN
+        PERFORM pg_notify('repair_procedures_changed', new_id);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS notify_repair_procedures_change ON repair_procedures;
+CREATE TRIGGER notify_repair_procedures_change AFTER INSERT OR UPDATE OR DELETE ON repair_procedures
+    FOR EACH ROW EXECUTE FUNCTION notify_repair_procedure_change('id');
+
+DROP TRIGGER IF EXISTS notify_procedure_steps_change ON procedure_steps;
+CREATE TRIGGER notify_procedure_steps_change AFTER INSERT OR UPDATE OR DELETE ON procedure_steps
+    FOR EACH ROW EXECUTE FUNCTION notify_repair_procedure_change('procedure_id');
+
+DROP TRIGGER IF EXISTS notify_procedure_feedback_change ON procedure_feedback;
+CREATE TRIGGER notify_procedure_feedback_change AFTER INSERT OR UPDATE OR DELETE ON procedure_feedback
+    FOR EACH ROW EXECUTE FUNCTION notify_repair_procedure_change('procedure_id');
+
+DROP TRIGGER IF EXISTS notify_repair_procedures_truncate ON repair_procedures;
+CREATE TRIGGER notify_repair_procedures_truncate AFTER TRUNCATE ON repair_procedures
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_repair_procedure_change('id');
+
+DROP TRIGGER IF EXISTS notify_procedure_steps_truncate ON procedure_steps;
+CREATE TRIGGER notify_procedure_steps_truncate AFTER TRUNCATE ON procedure_steps
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_repair_procedure_change('procedure_id');
+
+DROP TRIGGER IF EXISTS notify_procedure_feedback_truncate ON procedure_feedback;
+CREATE TRIGGER notify_procedure_feedback_truncate AFTER TRUNCATE ON procedure_feedback
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_repair_procedure_change('procedure_id');
+
+COMMIT;
+
+-- Verify the migration
+SELECT event_object_table, trigger_name, event_manipulation
+FROM information_schema.triggers
+WHERE action_statement LIKE '%notify_repair_procedure_change%'
+ORDER BY event_object_table, event_manipulation;
@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+"""
+RevivaTech Database Pool
+Process-wide PostgreSQL connection pool for the NLU services.
+
+Every KnowledgeBaseService used to open its own psycopg2 connection and keep
+it until the process exited; once that connection broke, every query failed.
+ConnectionPool hands out autocommit connections from a bounded pool, checks
+each one before lending it out and replaces connections that died, and waits
+(up to a timeout) instead of opening more than max_size connections. One
+shared pool per process is returned by get_shared_pool().
+
+PreparedStatement runs a hot query by name: it is PREPAREd on each pooled
+connection the first time it runs there, so Postgres parses and plans it once
+per connection instead of on every request.
+"""
+
+import os
+import re
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
+
+import nlu_config
+
+logger = logging.getLogger(__name__)
+
+# Errors that mean the connection itself is unusable
+CONNECTION_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+
+class PoolTimeout(Exception):
+    """No connection became available within the checkout timeout"""
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    """psycopg2 connection that remembers which statements are prepared in its session"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements = set()
+
+
+class ConnectionPool:
+    """
+    Bounded pool of autocommit psycopg2 connections.
+
+    Up to min_size connections are opened eagerly and kept idle. A checkout
+    reuses an idle connection (validated with SELECT 1 when it has been idle
+    for validate_idle seconds or more; 0 validates every borrow), opens a new
+    one while fewer than max_size exist, or waits up to timeout seconds for a
+    connection to be returned and raises PoolTimeout otherwise. A connection
+    that fails with a connection error inside connection() is discarded and
+    its slot refilled, so one that died within validate_idle costs one failed
+    query rather than a SELECT 1 round trip on every borrow.
+    """
+
+    def __init__(
+        self,
+        connect_kwargs: Dict[str, Any],
+        min_size: int = 1,
+        max_size: int = 10,
+        timeout: float = 5.0,
+        validate_idle: float = 30.0,
+        connect: Callable[..., Any] = psycopg2.connect
+    ):
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError(f"Invalid pool size: min_size={min_size}, max_size={max_size}")
+
+        self.connect_kwargs = dict(connect_kwargs)
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.validate_idle = validate_idle
+        self._connect = connect
+        self.pid = os.getpid()
+
+        self._condition = threading.Condition()
+        self._idle: deque = deque()  # (connection, returned_at), most recently returned last
+        self._size = 0  # open connections, idle and in use
+        self._closed = False
+
+        self.stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_ms_total": 0.0,
+            "wait_ms_max": 0.0,
+            "timeouts": 0,
+            "connections_opened": 0,
+            "connections_replaced": 0,
+            "connect_errors": 0,
+            "peak_in_use": 0
+        }
+
+        self._fill()
+
+    def _open(self):
+        connection = self._connect(**self.connect_kwargs, connection_factory=PooledConnection)
+        connection.autocommit = True
+        self.stats["connections_opened"] += 1
+        return connection
+
+    def _fill(self):
+        """Open connections until min_size exist (failures are logged and retried on checkout)"""
+        while True:
+            with self._condition:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                connection = self._open()
+            except Exception as e:
+                with self._condition:
+                    self._size -= 1
+                    self.stats["connect_errors"] += 1
+                logger.error(f"❌ Database connection failed: {e}")
+                return
+            with self._condition:
+                self._idle.append((connection, time.monotonic()))
+                self._condition.notify()
+
+    @staticmethod
+    def _discard(connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _is_usable(self, connection, idle_for: float) -> bool:
+        """Validate a connection before lending it out"""
+        if connection.closed:
+            return False
+        if idle_for < self.validate_idle:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+                cursor.fetchone()
+            return True
+        except CONNECTION_ERRORS:
+            return False
+
+    def getconn(self, timeout: Optional[float] = None):
+        """Borrow a connection; must be handed back with putconn()"""
+        if timeout is None:
+            timeout = self.timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        waited = False
+
+        while True:
+            with self._condition:
+                while True:
+                    if self._closed:
+                        raise PoolTimeout("Connection pool is closed")
+                    if self._idle:
+                        connection, returned_at = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        connection, returned_at = None, None
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.stats["timeouts"] += 1
+                        raise PoolTimeout(f"No database connection available within {timeout:.1f}s "
+                                          f"({self.max_size} in use)")
+                    waited = True
+                    self._condition.wait(remaining)
+
+            if connection is not None:
+                if self._is_usable(connection, time.monotonic() - returned_at):
+                    break
+                # Dead connection: drop it and open a replacement in the same slot
+                self._discard(connection)
+                self.stats["connections_replaced"] += 1
+
+            try:
+                connection = self._open()
+                break
+            except Exception:
+                with self._condition:
+                    self._size -= 1
+                    self.stats["connect_errors"] += 1
+                    self._condition.notify()
+                raise
+
+        wait_ms = (time.monotonic() - started) * 1000
+        with self._condition:
+            self.stats["checkouts"] += 1
+            if waited:
+                self.stats["waits"] += 1
+            self.stats["wait_ms_total"] += wait_ms
+            self.stats["wait_ms_max"] = max(self.stats["wait_ms_max"], wait_ms)
+            self.stats["peak_in_use"] = max(self.stats["peak_in_use"], self._size - len(self._idle))
+        return connection
+
+    def putconn(self, connection, discard: bool = False):
+        """Return a borrowed connection (closed or discarded connections free their slot)"""
+        if not discard and not connection.closed:
+            # A failed statement outside autocommit would leave the session aborted
+            try:
+                if connection.status != psycopg2.extensions.STATUS_READY:
+                    connection.rollback()
+            except CONNECTION_ERRORS:
+                discard = True
+
+        discard = discard or connection.closed
+        with self._condition:
+            if discard or self._closed:
+                self._size -= 1
+                self._discard(connection)
+            else:
+                self._idle.append((connection, time.monotonic()))
+            self._condition.notify()
+
+        if discard:
+            self._fill()
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None):
+        """Borrow a connection for the duration of a with block"""
+        connection = self.getconn(timeout)
+        try:
+            yield connection
+        except CONNECTION_ERRORS:
+            self.putconn(connection, discard=True)
+            raise
+        except BaseException:
+            self.putconn(connection)
+            raise
+        else:
+            self.putconn(connection)
+
+    def close(self):
+        """Close idle connections now and in-use ones when they are returned"""
+        with self._condition:
+            self._closed = True
+            while self._idle:
+                connection, _ = self._idle.popleft()
+                self._size -= 1
+                self._discard(connection)
+            self._condition.notify_all()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._condition:
+            idle = len(self._idle)
+            in_use = self._size - idle
+            checkouts = self.stats["checkouts"]
+            return {
+                **self.stats,
+                "wait_ms_total": round(self.stats["wait_ms_total"], 2),
+                "wait_ms_max": round(self.stats["wait_ms_max"], 2),
+                "wait_ms_avg": round(self.stats["wait_ms_total"] / checkouts, 3) if checkouts else 0.0,
+                "wait_rate": round(self.stats["waits"] / checkouts, 4) if checkouts else 0.0,
+                "size": self._size,
+                "idle": idle,
+                "in_use": in_use,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "saturation": round(in_use / self.max_size, 4)
+            }
+
+
+_PLACEHOLDER = re.compile(r"%\((\w+)\)s|%s|%%")
+
+
+def _numbered_parameters(query: str) -> Tuple[str, List[Union[str, int]]]:
+    """Rewrite psycopg2 placeholders (%(name)s or %s) as $1, $2, ... for PREPARE"""
+    keys: List[Union[str, int]] = []
+
+    def number(match):
+        if match.group(0) == "%%":
+            return "%"
+        key = match.group(1) if match.group(1) is not None else len(keys)
+        if key not in keys:
+            keys.append(key)
+        return f"${keys.index(key) + 1}"
+
+    return _PLACEHOLDER.sub(number, query), keys
+
+
+class PreparedStatement:
+    """
+    Named server-side prepared statement for a psycopg2-style query.
+
+    execute() PREPAREs the statement on the cursor's connection the first time
+    it runs there (a new or replaced connection starts with none) and then
+    sends only EXECUTE name(args). A statement the server no longer knows, or
+    whose cached plan was invalidated by a schema change, is prepared again
+    and retried once.
+    """
+
+    def __init__(self, name: str, query: str):
+        self.name = name
+        self.query = query
+        self.sql, self.keys = _numbered_parameters(query)
+        self.stats = {"executions": 0, "prepares": 0, "reprepares": 0, "prepare_ms": 0.0}
+
+    def _arguments(self, params: Union[Tuple, Dict, None]) -> List[Any]:
+        if not self.keys:
+            return []
+        return [params[key] for key in self.keys]
+
+    def _prepare(self, cursor):
+        started = time.perf_counter()
+        cursor.execute(f"PREPARE {self.name} AS {self.sql}")
+        self.stats["prepares"] += 1
+        self.stats["prepare_ms"] += (time.perf_counter() - started) * 1000
+        cursor.connection.prepared_statements.add(self.name)
+
+    def execute(self, cursor, params: Union[Tuple, Dict, None] = None):
+        prepared = getattr(cursor.connection, "prepared_statements", None)
+        if prepared is None:
+            # Not a pooled connection: nowhere to remember the statement
+            cursor.execute(self.query, params)
+            return
+
+        arguments = self._arguments(params)
+        execute_sql = f"EXECUTE {self.name}({', '.join(['%s'] * len(arguments))})" if arguments else f"EXECUTE {self.name}"
+        for attempt in range(2):
+            if self.name not in prepared:
+                self._prepare(cursor)
+            try:
+                cursor.execute(execute_sql, arguments)
+                self.stats["executions"] += 1
+                return
+            except psycopg2.errors.InvalidSqlStatementName:
+                # The session lost it (e.g. DISCARD ALL behind a proxy)
+                prepared.discard(self.name)
+                if attempt:
+                    raise
+            except psycopg2.errors.FeatureNotSupported as e:
+                # "cached plan must not change result type" after a migration
+                if attempt or "cached plan" not in str(e):
+                    raise
+                cursor.execute(f"DEALLOCATE {self.name}")
+                prepared.discard(self.name)
+            self.stats["reprepares"] += 1
+
+
+def database_config() -> Dict[str, Any]:
+    """psycopg2.connect arguments from the NLU_DB_* settings"""
+    return {
+        "host": nlu_config.DB_HOST,
+        "port": nlu_config.DB_PORT,
+        "database": nlu_config.DB_NAME,
+        "user": nlu_config.DB_USER,
+        "password": nlu_config.DB_PASSWORD,
+        "connect_timeout": nlu_config.DB_CONNECT_TIMEOUT
+    }
+
+
+_shared_pool: Optional[ConnectionPool] = None
+_shared_pool_lock = threading.Lock()
+# Pools inherited over a fork; kept referenced so their sockets are never
+# finalised in the child, which would end the parent's sessions
+_inherited_pools = []
+
+
+def get_shared_pool() -> ConnectionPool:
+    """The process-wide pool, created on first use (and again in a forked child)"""
+    global _shared_pool
+    with _shared_pool_lock:
+        if _shared_pool is not None and _shared_pool.pid != os.getpid():
+            _inherited_pools.append(_shared_pool)
+            _shared_pool = None
+        if _shared_pool is None:
+            _shared_pool = ConnectionPool(
+                database_config(),
+                min_size=nlu_config.DB_POOL_MIN_SIZE,
+                max_size=nlu_config.DB_POOL_MAX_SIZE,
+                timeout=nlu_config.DB_POOL_TIMEOUT,
+                validate_idle=nlu_config.DB_POOL_VALIDATE_IDLE
+            )
+        return _shared_pool
+
+
+def close_shared_pool():
+    """Close the process-wide pool (e.g. in a parent process before forking workers)"""
+    global _shared_pool
+    with _shared_pool_lock:
+        if _shared_pool is not None and _shared_pool.pid == os.getpid():
+            _shared_pool.close()
+        _shared_pool = None
@@ -4,19 +4,77 @@ RevivaTech Enhanced Device Matcher - Phase 2
 Combines Matomo Device Detector with spaCy NLU for 98%+ accuracy
 """
 
+import os
 import re
 import json
 import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeoutError
 from typing import Dict, List, Tuple, Optional, Any
-from dataclasses import dataclass
-from cachetools import TTLCache
-from fuzzywuzzy import fuzz, process
+from dataclasses import dataclass, asdict, replace
+from fuzzywuzzy import fuzz, process, utils as fuzz_utils
+
+# C-accelerated fuzzy scoring (optional, falls back to fuzzywuzzy)
+try:
+    from rapidfuzz import fuzz as rapid_fuzz, process as rapid_process, utils as rapid_utils
+except ImportError:
+    rapid_process = None
 
 # Device detection libraries
 from device_detector import DeviceDetector
 from user_agents import parse as parse_user_agent
 import ua_parser
 
+import nlu_config
+from ngram_index import NGramIndex
+from nlu_cache import InstrumentedTTLCache
+from shared_cache import SQLiteCache
+from pattern_automaton import TokenTrie
+
+# Catalogues at least this large get an n-gram index for candidate selection
+MODEL_INDEX_THRESHOLD = 1000
+
+def best_partial_match(query: str, choices: List[str], min_score: int = 60) -> Optional[Tuple[str, int]]:
+    """
+    Best choice for query by fuzzywuzzy's partial_ratio, or None if no score exceeds min_score.
+    
+    When rapidfuzz is available its C partial_ratio bounds the search: it
+    scores the optimal alignment, so it never scores a choice below fuzzywuzzy
+    does. Choices are scored by fuzzywuzzy best bound first, stopping once no
+    remaining bound can reach the best score, and ties keep the earliest
+    choice, so the winner and its score are exactly what extractOne returns.
+    """
+    if not choices:
+        return None
+    
+    if rapid_process is None:
+        match = process.extractOne(query, choices, scorer=fuzz.partial_ratio)
+        if match is None:
+            return None
+        choice, score = match[0], match[1]
+        return (choice, score) if score > min_score else None
+    
+    candidates = rapid_process.extract(
+        query, choices,
+        scorer=rapid_fuzz.partial_ratio,
+        processor=rapid_utils.default_process,
+        score_cutoff=min_score,
+        limit=None
+    )
+    # Same preprocessing as extractOne applies before partial_ratio
+    processed_query = fuzz_utils.full_process(query)
+    best = None
+    for choice, bound, index in sorted(candidates, key=lambda candidate: (-candidate[1], candidate[2])):
+        # fuzzywuzzy rounds its score, so a bound within 0.5 can still tie
+        if best is not None and bound < best[1] - 0.5:
+            break
+        score = fuzz.partial_ratio(processed_query, fuzz_utils.full_process(choice))
+        if best is None or score > best[1] or (score == best[1] and index < best[2]):
+            best = (choice, score, index)
+    
+    if best is None or best[1] <= min_score:
+        return None
+    return best[0], best[1]
+
 @dataclass
 class DeviceMatch:
     """Enhanced device match result"""
@@ -26,6 +84,78 @@ class DeviceMatch:
     confidence: float
     source: str  # 'text', 'user_agent', 'database', 'hybrid'
     raw_data: Optional[Dict] = None
+    
+    def to_json(self) -> str:
+        return json.dumps(asdict(self), default=str)
+    
+    @classmethod
+    def from_json(cls, payload: str) -> "DeviceMatch":
+        return cls(**json.loads(payload))
+
+def parse_user_agent_matomo(user_agent: str) -> Optional[DeviceMatch]:
+    """Matomo Device Detector parse; None unless Matomo reports a mobile device"""
+    detector = DeviceDetector(user_agent).parse()
+    
+    if not detector.is_mobile():
+        return None
+    
+    brand = detector.device_brand() or "Unknown"
+    model = detector.device_model() or "Unknown Model"
+    is_tablet = detector.device_type() == "tablet"
+    
+    return DeviceMatch(
+        brand,
+        f"{brand} {model}" if model != "Unknown Model" else brand,
+        "Tablet" if is_tablet else "Smartphone",
+        0.9,  # High confidence for user agent parsing
+        "user_agent_matomo",
+        {
+            "os": f"{detector.os_name()} {detector.os_version()}".strip(),
+            "browser": detector.client_name(),
+            "is_mobile": True,
+            "is_tablet": is_tablet
+        }
+    )
+
+def parse_user_agent_alternative(user_agent: str) -> Optional[DeviceMatch]:
+    """ua-parser based match, used when Matomo does not report a mobile device"""
+    parsed = parse_user_agent(user_agent)
+    if parsed.device.brand and parsed.device.model:
+        return DeviceMatch(
+            parsed.device.brand,
+            f"{parsed.device.brand} {parsed.device.model}",
+            parsed.device.family or "Unknown Device",
+            0.8,
+            "user_agent_alternative",
+            {
+                "os": str(parsed.os),
+                "browser": str(parsed.browser),
+                "device_family": parsed.device.family
+            }
+        )
+    return None
+
+def parse_user_agent_full(user_agent: str) -> Optional[DeviceMatch]:
+    """Matomo, then ua-parser - the slow tiers, run in the UA worker processes"""
+    return parse_user_agent_matomo(user_agent) or parse_user_agent_alternative(user_agent)
+
+# Parsed once by every UA worker at start-up so Matomo's lazily compiled regexes are warm
+WARM_UP_USER_AGENTS = [
+    "Mozilla/5.0 (Linux; Android 13; 2201116SG) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Mobile Safari/537.36",
+    "Mozilla/5.0 (Linux; Android 11; CPH2239) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Mobile Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+]
+
+def _warm_user_agent_worker():
+    """ProcessPoolExecutor initializer for the UA workers"""
+    for user_agent in WARM_UP_USER_AGENTS:
+        try:
+            parse_user_agent_full(user_agent)
+        except Exception:
+            pass
+
+# Returned by the UA pool when a parse misses its deadline
+_PENDING = object()
 
 class EnhancedDeviceMatcher:
     """
@@ -36,17 +166,62 @@ class EnhancedDeviceMatcher:
     4. Historical repair data patterns
     """
     
-    def __init__(self):
-        self.device_detector = DeviceDetector("")  # Initialize with empty user agent
+    CACHE_BACKENDS = ("memory", "sqlite")
+    
+    def __init__(
+        self,
+        cache_backend: Optional[str] = None,
+        user_agent_workers: Optional[int] = None,
+        user_agent_deadline_ms: Optional[float] = None
+    ):
+        """
+        cache_backend (default NLU_DEVICE_CACHE_BACKEND) selects where text and
+        user agent matches are cached: "memory" keeps a per-process TTLCache,
+        "sqlite" shares one cache file between all worker processes.
         
-        # Cache for performance (5 minute TTL)
-        self.cache = TTLCache(maxsize=1000, ttl=300)
+        user_agent_workers (default NLU_UA_PARSE_WORKERS) > 0 runs the slow UA
+        parse in a pre-warmed process pool, waiting at most user_agent_deadline_ms
+        (default NLU_UA_PARSE_DEADLINE_MS); late results are cached for next time.
+        """
+        # Cache for performance (5 minute TTL by default)
+        self.cache = self._create_cache(cache_backend)
         
         # Device database - expanded from Phase 1
         self.device_patterns = self._load_device_patterns()
         self.brand_aliases = self._load_brand_aliases()
+        self.brand_trie = self._build_brand_trie()
         self.model_patterns = self._load_model_patterns()
         
+        # Precompiled regexes for the device patterns
+        self._compile_device_patterns()
+        
+        # Flattened model catalogue per brand for fuzzy model extraction
+        self.model_catalogues = self._build_model_catalogues()
+        self.model_indexes: Dict[str, NGramIndex] = {}
+        for brand in self.model_catalogues:
+            self._index_model_catalogue(brand)
+        
+        # Precompiled fast path for the most common user agent families
+        self.user_agent_fast_paths = self._load_user_agent_fast_paths()
+        self.samsung_model_codes = self._load_samsung_model_codes()
+        
+        # Optional process pool for the slow UA tiers
+        if user_agent_workers is None:
+            user_agent_workers = nlu_config.UA_PARSE_WORKERS
+        if user_agent_deadline_ms is None:
+            user_agent_deadline_ms = nlu_config.UA_PARSE_DEADLINE_MS
+        self.user_agent_workers = user_agent_workers
+        self.user_agent_deadline = user_agent_deadline_ms / 1000.0
+        self._user_agent_pool = None
+        self._user_agent_pool_pid = None
+        self._pending_user_agents: Dict[str, Any] = {}
+        self._late_user_agent_matches: Dict[str, DeviceMatch] = {}
+        self.user_agent_pool_stats = {
+            "submitted": 0, "in_time": 0, "deadline_exceeded": 0, "late_results": 0, "errors": 0
+        }
+        if self.user_agent_workers > 0:
+            self.start_user_agent_pool()
+        
         # Repair-specific patterns from RevivaTech history
         self.repair_patterns = self._load_repair_patterns()
         
@@ -54,6 +229,27 @@ class EnhancedDeviceMatcher:
         print(f"📱 Device patterns: {len(self.device_patterns)}")
         print(f"🏷️  Brand aliases: {len(self.brand_aliases)}")
         print(f"🔧 Repair patterns: {len(self.repair_patterns)}")
+        print(f"🗄️  Match cache: {type(self.cache).__name__}")
+
+    def _create_cache(self, cache_backend: Optional[str] = None):
+        """Device match cache for the selected backend"""
+        cache_backend = (cache_backend or nlu_config.DEVICE_CACHE_BACKEND).lower()
+        if cache_backend not in self.CACHE_BACKENDS:
+            raise ValueError(f"cache_backend must be one of {self.CACHE_BACKENDS}, got {cache_backend!r}")
+        
+        if cache_backend == "sqlite":
+            return SQLiteCache(
+                nlu_config.DEVICE_CACHE_PATH,
+                ttl=nlu_config.DEVICE_CACHE_TTL,
+                max_bytes=nlu_config.DEVICE_CACHE_MAX_BYTES,
+                dumps=DeviceMatch.to_json,
+                loads=DeviceMatch.from_json
+            )
+        return InstrumentedTTLCache(maxsize=nlu_config.DEVICE_CACHE_MAXSIZE, ttl=nlu_config.DEVICE_CACHE_TTL)
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Hit/miss/eviction counters and size of the device match cache"""
+        return {"backend": "sqlite" if isinstance(self.cache, SQLiteCache) else "memory", **self.cache.get_stats()}
 
     def _load_device_patterns(self) -> Dict[str, List[Dict]]:
         """Load comprehensive device pattern database"""
@@ -170,6 +366,69 @@ class EnhancedDeviceMatcher:
             ]
         }
 
+    def _compile_device_patterns(self):
+        """
+        Precompile device_patterns once instead of going through the re cache per call.
+        
+        Builds, in brand priority order, one alternation per brand (a cheap
+        "can any pattern of this brand match?" check) plus one compiled object
+        per pattern, and a single alternation over every pattern so messages
+        without any device model mention skip the pattern stage entirely.
+        """
+        self.compiled_device_patterns = []
+        all_patterns = []
+        
+        for brand, patterns in self.device_patterns.items():
+            compiled = [
+                (re.compile(pattern_info["pattern"], re.IGNORECASE), pattern_info)
+                for pattern_info in patterns
+            ]
+            brand_alternation = "|".join(f"(?:{pattern_info['pattern']})" for pattern_info in patterns)
+            self.compiled_device_patterns.append(
+                (brand, re.compile(brand_alternation, re.IGNORECASE), compiled)
+            )
+            all_patterns.append(brand_alternation)
+        
+        self.device_pattern_prefilter = re.compile("|".join(all_patterns), re.IGNORECASE)
+
+    def _build_model_catalogues(self) -> Dict[str, List[str]]:
+        """Flatten every brand's model lists once, in pattern order"""
+        catalogues = {}
+        for brand, patterns in self.device_patterns.items():
+            all_models = []
+            for pattern_info in patterns:
+                for models_list in pattern_info["models"].values():
+                    all_models.extend(models_list)
+            catalogues[brand] = all_models
+        return catalogues
+
+    def _index_model_catalogue(self, brand: str):
+        """(Re)build the n-gram index for a brand once its catalogue is large enough"""
+        models = self.model_catalogues.get(brand, [])
+        if len(models) >= MODEL_INDEX_THRESHOLD:
+            self.model_indexes[brand] = NGramIndex(models)
+        else:
+            self.model_indexes.pop(brand, None)
+
+    def load_model_catalogue(self, brand: str, models: List[str], replace: bool = False) -> int:
+        """
+        Load additional model names (e.g. parts database SKUs) for fuzzy lookup.
+        
+        Returns the catalogue size for the brand after loading.
+        """
+        brand = brand.lower()
+        catalogue = [] if replace else list(self.model_catalogues.get(brand, []))
+        seen = set(catalogue)
+        for model in models:
+            if model and model not in seen:
+                seen.add(model)
+                catalogue.append(model)
+        
+        self.model_catalogues[brand] = catalogue
+        self._index_model_catalogue(brand)
+        self.cache.clear()
+        return len(catalogue)
+
     def _load_brand_aliases(self) -> Dict[str, List[str]]:
         """Load brand name aliases and variations"""
         return {
@@ -194,6 +453,14 @@ class EnhancedDeviceMatcher:
             "lenovo": ["lenovo", "thinkpad"]
         }
 
+    def _build_brand_trie(self) -> TokenTrie:
+        """Token trie over every brand alias; values carry the brand's priority (dict order)"""
+        trie = TokenTrie()
+        for priority, (brand, aliases) in enumerate(self.brand_aliases.items()):
+            for alias in aliases:
+                trie.add(alias, (priority, brand))
+        return trie
+
     def _load_model_patterns(self) -> Dict[str, str]:
         """Load model-specific patterns for better recognition"""
         return {
@@ -218,6 +485,75 @@ class EnhancedDeviceMatcher:
             "smartwatch": r"(watch|apple\s*watch|galaxy\s*watch)"
         }
 
+    def _load_user_agent_fast_paths(self) -> Dict[str, Any]:
+        """Precompiled user agent prefilter (anything it does not recognise goes to Matomo)"""
+        return {
+            "apple": re.compile(r"\((iPhone|iPad);.*?\bOS (\d+(?:_\d+)*) like Mac OS X"),
+            "samsung": re.compile(
+                r"\bAndroid ([\d.]+); (?:SAMSUNG )?SM-([A-Z]\d{3})[A-Z0-9]*(?: Build/[^;)]*)?(?:; wv)?\)"
+            ),
+            "pixel": re.compile(
+                r"\bAndroid ([\d.]+); (Pixel(?: [A-Za-z0-9]+)*?)(?: Build/[^;)]*)?(?:; wv)?\)"
+            ),
+            "desktop": re.compile(r"\((?:Windows NT [\d.]+|Macintosh|X11)[;)]"),
+            "mobile_hint": re.compile(r"Mobile|Android|iPhone|iPad|iPod|Tablet|Touch")
+        }
+
+    def _load_samsung_model_codes(self) -> Dict[str, Tuple[str, str]]:
+        """SM-xxxx model code (without region suffix) -> (model name, device type), as Matomo names them"""
+        return {
+            # Galaxy S
+            "G973": ("Galaxy S10", "Smartphone"),
+            "G781": ("Galaxy S20 FE 5G", "Smartphone"),
+            "G991": ("Galaxy S21 5G", "Smartphone"),
+            "G996": ("Galaxy S21+ 5G", "Smartphone"),
+            "G998": ("Galaxy S21 Ultra 5G", "Smartphone"),
+            "G990": ("Galaxy S21 FE 5G", "Smartphone"),
+            "S901": ("Galaxy S22", "Smartphone"),
+            "S906": ("Galaxy S22+", "Smartphone"),
+            "S908": ("Galaxy S22 Ultra", "Smartphone"),
+            "S911": ("Galaxy S23", "Smartphone"),
+            "S916": ("Galaxy S23+", "Smartphone"),
+            "S918": ("Galaxy S23 Ultra", "Smartphone"),
+            "S711": ("Galaxy S23 FE", "Smartphone"),
+            "S921": ("Galaxy S24", "Smartphone"),
+            "S926": ("Galaxy S24+", "Smartphone"),
+            "S928": ("Galaxy S24 Ultra", "Smartphone"),
+            "S721": ("Galaxy S24 FE", "Smartphone"),
+            # Galaxy A / M
+            "A045": ("Galaxy A04", "Smartphone"),
+            "A135": ("Galaxy A13", "Smartphone"),
+            "A145": ("Galaxy A14", "Smartphone"),
+            "A146": ("Galaxy A14 5G", "Smartphone"),
+            "A155": ("Galaxy A15", "Smartphone"),
+            "A156": ("Galaxy A15 5G", "Smartphone"),
+            "A256": ("Galaxy A25 5G", "Smartphone"),
+            "A346": ("Galaxy A34 5G", "Smartphone"),
+            "A515": ("Galaxy A51", "Smartphone"),
+            "A356": ("Galaxy A35 5G", "Smartphone"),
+            "A526": ("Galaxy A52 5G", "Smartphone"),
+            "A536": ("Galaxy A53 5G", "Smartphone"),
+            "A546": ("Galaxy A54 5G", "Smartphone"),
+            "A556": ("Galaxy A55 5G", "Smartphone"),
+            "M135": ("Galaxy M13", "Smartphone"),
+            "M346": ("Galaxy M34 5G", "Smartphone"),
+            # Galaxy Z / Note
+            "F711": ("Galaxy Z Flip 3", "Smartphone"),
+            "F721": ("Galaxy Z Flip 4", "Smartphone"),
+            "F731": ("Galaxy Z Flip 5", "Smartphone"),
+            "F926": ("Galaxy Z Fold 3 5G", "Smartphone"),
+            "F936": ("Galaxy Z Fold 4", "Smartphone"),
+            "F946": ("Galaxy Z Fold 5", "Smartphone"),
+            "N981": ("Galaxy Note 20 5G", "Smartphone"),
+            "N986": ("Galaxy Note 20 Ultra 5G", "Smartphone"),
+            # Galaxy Tab
+            "X110": ('Galaxy Tab A9 8.7" WiFi', "Tablet"),
+            "X200": ('Galaxy Tab A8 10.5" WiFi', "Tablet"),
+            "X710": ('Galaxy Tab S9 11" WiFi', "Tablet"),
+            "X716": ('Galaxy Tab S9 12.4" 5G', "Tablet"),
+            "X810": ('Galaxy Tab S9+ 12.4"', "Tablet")
+        }
+
     def _load_repair_patterns(self) -> Dict[str, Dict]:
         """Load repair-specific patterns from RevivaTech history"""
         return {
@@ -243,26 +579,60 @@ class EnhancedDeviceMatcher:
         
         # Check cache first
         cache_key = f"text_{text_lower}"
-        if cache_key in self.cache:
-            return self.cache[cache_key]
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return cached
         
+        # 1. Direct pattern matching (highest confidence)
+        best_match = self._match_device_patterns(text_lower)
+        
+        # 2. Brand detection with fuzzy model matching
+        if best_match.confidence < 0.8:
+            brand_hits = self.detect_brands(text_lower)
+            detected_brand = self._detect_brand(text_lower, brand_hits)
+            if detected_brand:
+                # Try to extract model using fuzzy matching
+                model = self._extract_model_fuzzy(text_lower, detected_brand)
+                if model:
+                    device_type = self._determine_device_type(model)
+                    confidence = 0.75 if model != "Unknown Model" else 0.5
+                    best_match = DeviceMatch(
+                        detected_brand.title(),
+                        model,
+                        device_type,
+                        confidence,
+                        "text_fuzzy",
+                        {"brand_method": "fuzzy", "brand_hits": brand_hits}
+                    )
+        
+        # Cache result
+        self.cache[cache_key] = best_match
+        return best_match
+
+    def _match_device_patterns(self, text_lower: str) -> DeviceMatch:
+        """Direct model pattern matching using the precompiled device patterns"""
         best_match = DeviceMatch("Unknown", "Unknown Model", "Unknown Device", 0.1, "text")
         
-        # 1. Direct pattern matching (highest confidence)
-        for brand, patterns in self.device_patterns.items():
-            for pattern_info in patterns:
-                pattern = pattern_info["pattern"]
+        # One scan rules out messages that mention no known model family
+        if not self.device_pattern_prefilter.search(text_lower):
+            return best_match
+        
+        for brand, brand_regex, compiled_patterns in self.compiled_device_patterns:
+            if not brand_regex.search(text_lower):
+                continue
+            
+            for regex, pattern_info in compiled_patterns:
                 models = pattern_info["models"]
                 
-                match = re.search(pattern, text_lower, re.IGNORECASE)
+                match = regex.search(text_lower)
                 if match:
                     model_key = match.group(1) if match.groups() else ""
                     possible_models = models.get(model_key, models.get("", []))
                     
                     if possible_models:
                         # Use fuzzy matching to find best model
-                        model_match = process.extractOne(text_lower, possible_models, scorer=fuzz.partial_ratio)
-                        if model_match and model_match[1] > 60:
+                        model_match = best_partial_match(text_lower, possible_models)
+                        if model_match:
                             confidence = min(0.95, model_match[1] / 100.0)
                             device_type = self._determine_device_type(possible_models[0])
                             best_match = DeviceMatch(
@@ -271,103 +641,205 @@ class EnhancedDeviceMatcher:
                                 device_type,
                                 confidence,
                                 "text_pattern",
-                                {"pattern": pattern, "match": match.group()}
+                                {"pattern": pattern_info["pattern"], "match": match.group()}
                             )
                             break
             
             if best_match.confidence > 0.8:
                 break
         
-        # 2. Brand detection with fuzzy model matching
-        if best_match.confidence < 0.8:
-            detected_brand = self._detect_brand(text_lower)
-            if detected_brand:
-                # Try to extract model using fuzzy matching
-                model = self._extract_model_fuzzy(text_lower, detected_brand)
-                if model:
-                    device_type = self._determine_device_type(model)
-                    confidence = 0.75 if model != "Unknown Model" else 0.5
-                    best_match = DeviceMatch(
-                        detected_brand.title(),
-                        model,
-                        device_type,
-                        confidence,
-                        "text_fuzzy",
-                        {"brand_method": "fuzzy"}
-                    )
-        
-        # Cache result
-        self.cache[cache_key] = best_match
         return best_match
 
-    def match_device_from_user_agent(self, user_agent: str) -> DeviceMatch:
-        """Match device from user agent string using Matomo"""
+    def match_device_from_user_agent(self, user_agent: str, deadline_ms: Optional[float] = None) -> DeviceMatch:
+        """
+        Match device from user agent string.
+        
+        Common families (iPhone/iPad, Samsung Galaxy, Pixel, desktop browsers) are
+        resolved by the precompiled fast path; Matomo only parses the rest. With
+        the UA process pool enabled, a parse that misses its deadline returns a
+        "user_agent_pending" match (not cached) and its result is cached when it lands.
+        """
         if not user_agent:
             return DeviceMatch("Unknown", "Unknown Model", "Unknown Device", 0.1, "user_agent")
         
+        self._drain_late_user_agent_matches()
+        
         # Check cache
         cache_key = f"ua_{user_agent}"
-        if cache_key in self.cache:
-            return self.cache[cache_key]
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return cached
         
+        result = None
         try:
-            # Matomo Device Detector
-            self.device_detector = DeviceDetector(user_agent)
-            self.device_detector.parse()
+            tier, result = self._match_user_agent_fast(user_agent)
             
-            if self.device_detector.is_mobile() or self.device_detector.is_tablet():
-                brand = self.device_detector.get_brand() or "Unknown"
-                model = self.device_detector.get_model() or "Unknown Model"
-                device_type = "Tablet" if self.device_detector.is_tablet() else "Smartphone"
-                confidence = 0.9  # High confidence for user agent parsing
-                
-                result = DeviceMatch(
-                    brand,
-                    f"{brand} {model}" if model != "Unknown Model" else brand,
-                    device_type,
-                    confidence,
-                    "user_agent_matomo",
-                    {
-                        "os": self.device_detector.get_os(),
-                        "browser": self.device_detector.get_client(),
-                        "is_mobile": self.device_detector.is_mobile(),
-                        "is_tablet": self.device_detector.is_tablet()
-                    }
-                )
-                
-                self.cache[cache_key] = result
-                return result
+            # Matomo Device Detector only when the fast path is unsure
+            if tier == "unsure":
+                if self.user_agent_workers > 0:
+                    result = self._parse_user_agent_in_pool(user_agent, cache_key, deadline_ms)
+                    if result is _PENDING:
+                        return DeviceMatch(
+                            "Unknown", "Unknown Model", "Unknown Device", 0.1,
+                            "user_agent_pending", {"deadline_exceeded": True}
+                        )
+                else:
+                    result = self._match_user_agent_matomo(user_agent)
             
-            # Try alternative user agent parser
-            parsed = parse_user_agent(user_agent)
-            if parsed.device.brand and parsed.device.model:
-                confidence = 0.8
-                result = DeviceMatch(
-                    parsed.device.brand,
-                    f"{parsed.device.brand} {parsed.device.model}",
-                    parsed.device.family or "Unknown Device",
-                    confidence,
-                    "user_agent_alternative",
-                    {
-                        "os": str(parsed.os),
-                        "browser": str(parsed.browser),
-                        "device_family": parsed.device.family
-                    }
-                )
-                
-                self.cache[cache_key] = result
-                return result
+            # Try alternative user agent parser (desktops, unknown devices)
+            if result is None:
+                result = self._match_user_agent_alternative(user_agent)
                 
         except Exception as e:
             # Silently handle user agent parsing errors for clean JSON output
             pass
         
         # Fallback
-        result = DeviceMatch("Unknown", "Unknown Model", "Unknown Device", 0.1, "user_agent")
+        if result is None:
+            result = DeviceMatch("Unknown", "Unknown Model", "Unknown Device", 0.1, "user_agent")
         self.cache[cache_key] = result
         return result
 
-    def match_device_hybrid(self, text: str, user_agent: str = None) -> DeviceMatch:
+    def start_user_agent_pool(self):
+        """Start (and pre-warm) the UA worker processes for the current process"""
+        if self._user_agent_pool is not None and self._user_agent_pool_pid == os.getpid():
+            return
+        self._user_agent_pool = ProcessPoolExecutor(
+            max_workers=self.user_agent_workers,
+            initializer=_warm_user_agent_worker
+        )
+        self._user_agent_pool_pid = os.getpid()
+        self._pending_user_agents = {}
+        # Workers start (and run the warm-up initializer) on the first submission
+        for _ in range(self.user_agent_workers):
+            self._user_agent_pool.submit(os.getpid)
+
+    def close_user_agent_pool(self):
+        """Stop the UA worker processes (e.g. before forking NLU workers)"""
+        pool, self._user_agent_pool = self._user_agent_pool, None
+        if pool is not None and self._user_agent_pool_pid == os.getpid():
+            pool.shutdown(wait=False, cancel_futures=True)
+        self._user_agent_pool_pid = None
+        self._pending_user_agents = {}
+
+    def _parse_user_agent_in_pool(self, user_agent: str, cache_key: str, deadline_ms: Optional[float] = None):
+        """Matomo + ua-parser in the process pool; _PENDING if the deadline passes first"""
+        if self._user_agent_pool is None or self._user_agent_pool_pid != os.getpid():
+            self.start_user_agent_pool()
+        
+        future = self._pending_user_agents.get(cache_key)
+        if future is None:
+            future = self._user_agent_pool.submit(parse_user_agent_full, user_agent)
+            future.deadline_exceeded = False
+            self._pending_user_agents[cache_key] = future
+            future.add_done_callback(lambda done, key=cache_key: self._collect_user_agent_future(key, done))
+            self.user_agent_pool_stats["submitted"] += 1
+        
+        deadline = self.user_agent_deadline if deadline_ms is None else deadline_ms / 1000.0
+        try:
+            result = future.result(timeout=deadline)
+        except FuturesTimeoutError:
+            future.deadline_exceeded = True
+            if not future.done():
+                self.user_agent_pool_stats["deadline_exceeded"] += 1
+                return _PENDING
+            result = future.result()
+        except Exception:
+            # Broken pool or failed parse: restart the pool next time, fall back in-thread
+            self.user_agent_pool_stats["errors"] += 1
+            self.close_user_agent_pool()
+            return self._match_user_agent_matomo(user_agent)
+        
+        self.user_agent_pool_stats["in_time"] += 1
+        return result
+
+    def _collect_user_agent_future(self, cache_key: str, future):
+        """Done-callback (pool manager thread): keep late results for the next drain"""
+        self._pending_user_agents.pop(cache_key, None)
+        if not future.deadline_exceeded or future.cancelled() or future.exception() is not None:
+            return
+        self._late_user_agent_matches[cache_key] = future.result() or DeviceMatch(
+            "Unknown", "Unknown Model", "Unknown Device", 0.1, "user_agent"
+        )
+
+    def _drain_late_user_agent_matches(self):
+        """Move UA results that missed their deadline into the cache (request thread)"""
+        while self._late_user_agent_matches:
+            cache_key, match = self._late_user_agent_matches.popitem()
+            self.cache[cache_key] = match
+            self.user_agent_pool_stats["late_results"] += 1
+
+    def get_user_agent_pool_stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.user_agent_workers,
+            "deadline_ms": round(self.user_agent_deadline * 1000, 1),
+            "pending": len(self._pending_user_agents),
+            **self.user_agent_pool_stats
+        }
+
+    def _match_user_agent_fast(self, user_agent: str) -> Tuple[str, Optional[DeviceMatch]]:
+        """
+        Precompiled prefilter for the common user agent families.
+        
+        Returns ("device", match) for a recognised phone/tablet, ("desktop", None)
+        for desktop browsers (Matomo would not report a mobile device for them)
+        and ("unsure", None) for everything else.
+        """
+        fast_paths = self.user_agent_fast_paths
+        
+        apple = fast_paths["apple"].search(user_agent)
+        if apple:
+            device, version = apple.group(1), apple.group(2).replace("_", ".")
+            is_tablet = device == "iPad"
+            return "device", self._fast_user_agent_match(
+                "Apple", device, "Tablet" if is_tablet else "Smartphone",
+                f"{'iPadOS' if is_tablet else 'iOS'} {version}"
+            )
+        
+        samsung = fast_paths["samsung"].search(user_agent)
+        if samsung:
+            known = self.samsung_model_codes.get(samsung.group(2))
+            if known:
+                model, device_type = known
+                return "device", self._fast_user_agent_match(
+                    "Samsung", model, device_type, f"Android {samsung.group(1)}"
+                )
+            return "unsure", None
+        
+        pixel = fast_paths["pixel"].search(user_agent)
+        if pixel:
+            model = pixel.group(2)
+            device_type = "Tablet" if model.endswith("Tablet") else "Smartphone"
+            return "device", self._fast_user_agent_match("Google", model, device_type, f"Android {pixel.group(1)}")
+        
+        if fast_paths["desktop"].search(user_agent) and not fast_paths["mobile_hint"].search(user_agent):
+            return "desktop", None
+        
+        return "unsure", None
+
+    def _fast_user_agent_match(self, brand: str, model: str, device_type: str, os_name: str) -> DeviceMatch:
+        return DeviceMatch(
+            brand,
+            f"{brand} {model}",
+            device_type,
+            0.9,  # Same confidence as a Matomo parse
+            "user_agent_fast",
+            {
+                "os": os_name,
+                "is_mobile": True,
+                "is_tablet": device_type == "Tablet"
+            }
+        )
+
+    def _match_user_agent_matomo(self, user_agent: str) -> Optional[DeviceMatch]:
+        """Full Matomo Device Detector parse (a local detector per call, no shared state)"""
+        return parse_user_agent_matomo(user_agent)
+
+    def _match_user_agent_alternative(self, user_agent: str) -> Optional[DeviceMatch]:
+        """ua-parser based fallback for user agents Matomo does not report as mobile"""
+        return parse_user_agent_alternative(user_agent)
+
+    def match_device_hybrid(self, text: str, user_agent: str = None, user_agent_deadline_ms: Optional[float] = None) -> DeviceMatch:
         """
         Hybrid matching combining text and user agent analysis
         This is the main method that should be used for best accuracy
@@ -375,10 +847,23 @@ class EnhancedDeviceMatcher:
         # Get matches from both sources
         text_match = self.match_device_from_text(text)
         ua_match = None
+        user_agent_pending = False
         
         if user_agent:
-            ua_match = self.match_device_from_user_agent(user_agent)
+            ua_match = self.match_device_from_user_agent(user_agent, user_agent_deadline_ms)
+            if ua_match.source == "user_agent_pending":
+                # UA parse missed its deadline - answer from the text now, the UA is cached later
+                ua_match = None
+                user_agent_pending = True
         
+        match = self._combine_matches(text_match, ua_match)
+        if user_agent_pending:
+            # Tell callers not to cache a result the late UA parse will improve
+            match = replace(match, raw_data={**(match.raw_data or {}), "user_agent_pending": True})
+        return match
+
+    def _combine_matches(self, text_match: DeviceMatch, ua_match: Optional[DeviceMatch]) -> DeviceMatch:
+        """Pick or merge the text and user agent matches"""
         # Combine results intelligently
         if ua_match and ua_match.confidence > 0.8:
             # High confidence user agent match
@@ -480,26 +965,32 @@ class EnhancedDeviceMatcher:
         
         return insights
 
-    def _detect_brand(self, text: str) -> Optional[str]:
-        """Detect brand from text using aliases"""
-        for brand, aliases in self.brand_aliases.items():
-            for alias in aliases:
-                if alias in text:
-                    return brand
-        return None
+    def detect_brands(self, text: str) -> List[Dict[str, Any]]:
+        """Every brand alias mentioned in text (whole tokens only), with character positions"""
+        return [
+            {"brand": brand, "alias": alias, "start": start, "end": end, "priority": priority}
+            for start, end, alias, (priority, brand) in self.brand_trie.iter_matches(text)
+        ]
+
+    def _detect_brand(self, text: str, brand_hits: Optional[List[Dict[str, Any]]] = None) -> Optional[str]:
+        """Detect brand from text using aliases; brands earlier in brand_aliases win"""
+        if brand_hits is None:
+            brand_hits = self.detect_brands(text)
+        if not brand_hits:
+            return None
+        return min(brand_hits, key=lambda hit: hit["priority"])["brand"]
 
     def _extract_model_fuzzy(self, text: str, brand: str) -> str:
         """Extract model using fuzzy matching"""
-        if brand in self.device_patterns:
-            all_models = []
-            for pattern_info in self.device_patterns[brand]:
-                for models_list in pattern_info["models"].values():
-                    all_models.extend(models_list)
-            
-            if all_models:
-                match = process.extractOne(text, all_models, scorer=fuzz.partial_ratio)
-                if match and match[1] > 60:
-                    return match[0]
+        index = self.model_indexes.get(brand)
+        if index is not None:
+            choices = index.candidates(text)
+        else:
+            choices = self.model_catalogues.get(brand, [])
+        
+        match = best_partial_match(text, choices)
+        if match:
+            return match[0]
         
         return "Unknown Model"
 
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+RevivaTech Intent Engine
+Compiled keyword tables for the rule-based intent classifiers.
+
+The intent definitions are compiled once into a single keyword automaton that
+maps every keyword to the intents (and boost rules) it affects, so scoring a
+message is one pass over the text followed by a walk over the intents that
+actually matched. Scores are identical to evaluating the original tables with
+`pattern in text` for every pattern.
+"""
+
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from pattern_automaton import KeywordAutomaton
+
+
+@dataclass(frozen=True)
+class BoostRule:
+    """
+    Confidence added to an intent when the rule applies.
+
+    The rule applies when any of its keywords occurs in the message (or it has
+    no keywords) and its condition, if given, holds for the scoring context
+    (e.g. the device match).
+    """
+    amount: float
+    keywords: Tuple[str, ...] = ()
+    condition: Optional[Callable[[Any], bool]] = None
+
+
+class IntentEngine:
+    """
+    Rule-based intent scorer built once from an ordered intent table.
+
+    intents maps each intent name to {"patterns": [...], "confidence": float,
+    "boosts": [BoostRule, ...]}. An intent whose patterns occur in the message
+    scores its base confidence plus every applicable boost (added in rule order).
+    The first intent, in table order, that strictly beats default_confidence and
+    every earlier intent wins; max_confidence caps the reported value.
+    """
+
+    def __init__(
+        self,
+        intents: Dict[str, Dict],
+        default_intent: str = "general_inquiry",
+        default_confidence: float = 0.3,
+        max_confidence: Optional[float] = None
+    ):
+        self.default_intent = default_intent
+        self.default_confidence = default_confidence
+        self.max_confidence = max_confidence
+
+        self.intents: List[Tuple[str, float, Tuple[BoostRule, ...]]] = []
+        rules: List[BoostRule] = []
+        targets: Dict[str, List[Tuple[str, int]]] = {}
+
+        for intent_index, (intent, data) in enumerate(intents.items()):
+            boosts = tuple(data.get("boosts", ()))
+            self.intents.append((intent, data["confidence"], boosts))
+            for pattern in data["patterns"]:
+                targets.setdefault(pattern, []).append(("intent", intent_index))
+            for rule in boosts:
+                if rule not in rules:
+                    rules.append(rule)
+
+        self._rule_ids = {rule: rule_id for rule_id, rule in enumerate(rules)}
+        for rule, rule_id in self._rule_ids.items():
+            for keyword in rule.keywords:
+                targets.setdefault(keyword, []).append(("rule", rule_id))
+
+        # Substring semantics, same as the original `pattern in text` checks
+        self.automaton = KeywordAutomaton(word_boundaries="none")
+        for keyword, keyword_targets in targets.items():
+            self.automaton.add(keyword, tuple(dict.fromkeys(keyword_targets)))
+        self.automaton.build()
+
+    def _scan(self, text_lower: str) -> Tuple[set, set]:
+        """Indices of the intents and keyword rules triggered by the text"""
+        matched_intents, matched_rules = set(), set()
+        for keyword_targets in self.automaton.find_keywords(text_lower).values():
+            for kind, target in keyword_targets:
+                (matched_intents if kind == "intent" else matched_rules).add(target)
+        return matched_intents, matched_rules
+
+    def _rule_applies(self, rule: BoostRule, matched_rules: set, context: Any) -> bool:
+        if rule.keywords and self._rule_ids[rule] not in matched_rules:
+            return False
+        return rule.condition is None or rule.condition(context)
+
+    def scores(self, text_lower: str, context: Any = None) -> Dict[str, float]:
+        """Confidence of every intent whose patterns occur in the (lowercased) text"""
+        matched_intents, matched_rules = self._scan(text_lower)
+        scores = {}
+        for intent_index in sorted(matched_intents):
+            intent, confidence, boosts = self.intents[intent_index]
+            for rule in boosts:
+                if self._rule_applies(rule, matched_rules, context):
+                    confidence += rule.amount
+            scores[intent] = confidence
+        return scores
+
+    def boosts(self, text_lower: str, context: Any = None) -> Dict[str, float]:
+        """Sum of the applicable boosts of every intent, whether or not its patterns occur in the text"""
+        _, matched_rules = self._scan(text_lower)
+        totals = {}
+        for intent, _, boosts in self.intents:
+            total = 0.0
+            for rule in boosts:
+                if self._rule_applies(rule, matched_rules, context):
+                    total += rule.amount
+            totals[intent] = total
+        return totals
+
+    def classify(self, text_lower: str, context: Any = None) -> Dict:
+        """Best intent for the (lowercased) text, as {"intent", "confidence"}"""
+        best_intent, best_confidence = self.default_intent, self.default_confidence
+        for intent, confidence in self.scores(text_lower, context).items():
+            if confidence > best_confidence:
+                if self.max_confidence is not None:
+                    confidence = min(confidence, self.max_confidence)
+                best_intent, best_confidence = intent, confidence
+        return {"intent": best_intent, "confidence": best_confidence}
+
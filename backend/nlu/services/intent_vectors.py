@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+RevivaTech Intent Vectors
+Embedding-centroid intent classifier built from the training intent examples.
+
+Every example in `intent_examples` is embedded with the spaCy model's static
+word vectors (tokenizer + vector table only, no pipeline component runs). The
+normalised example vectors are averaged into one unit-length centroid per
+intent, and a message is scored against all centroids with a single matrix
+product; the cosine similarity of the best centroid is the confidence.
+"""
+
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+import nlu_config
+
+# Intent classifiers selectable on the NLU services
+INTENT_MODES = ("keyword", "centroid")
+
+
+def resolve_intent_mode(intent_mode: Optional[str] = None) -> str:
+    """Validate an intent mode, defaulting to NLU_INTENT_MODE"""
+    intent_mode = (intent_mode or nlu_config.INTENT_MODE).lower()
+    if intent_mode not in INTENT_MODES:
+        raise ValueError(f"intent_mode must be one of {INTENT_MODES}, got {intent_mode!r}")
+    return intent_mode
+
+
+def _normalise_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class CentroidIntentClassifier:
+    """
+    Nearest-centroid intent classifier over document vectors.
+
+    embed maps a list of texts to an (n, dim) array. Messages whose best
+    cosine similarity is below min_similarity (including messages with no
+    in-vocabulary tokens) fall back to default_intent/default_confidence,
+    matching the keyword classifiers' "nothing matched" result.
+    """
+
+    def __init__(
+        self,
+        examples: Dict[str, List[str]],
+        embed: Callable[[List[str]], np.ndarray],
+        default_intent: str = "general_inquiry",
+        default_confidence: float = 0.3,
+        min_similarity: float = 0.5
+    ):
+        self.embed = embed
+        self.default_intent = default_intent
+        self.default_confidence = default_confidence
+        self.min_similarity = min_similarity
+
+        self.labels: List[str] = []
+        centroids = []
+        for intent, texts in examples.items():
+            if not texts:
+                continue
+            example_vectors = _normalise_rows(np.asarray(embed(texts), dtype=np.float32))
+            self.labels.append(intent)
+            centroids.append(example_vectors.mean(axis=0))
+
+        if not centroids:
+            raise ValueError("No intent examples to build centroids from")
+
+        # (intents, dim) matrix of unit-length centroids
+        self.centroids = _normalise_rows(np.vstack(centroids))
+
+    def _scores(self, text: str) -> np.ndarray:
+        vector = _normalise_rows(np.asarray(self.embed([text]), dtype=np.float32))[0]
+        return self.centroids @ vector
+
+    def similarities(self, text: str) -> Dict[str, float]:
+        """Cosine similarity of the message to every intent centroid"""
+        return {label: float(score) for label, score in zip(self.labels, self._scores(text))}
+
+    def classify(self, text: str, boosts: Optional[Dict[str, float]] = None, max_confidence: float = 1.0) -> Dict:
+        """
+        Best intent for the message, as {"intent", "confidence"}.
+
+        boosts (e.g. IntentEngine.boosts) are added to the similarity of
+        every intent that reaches min_similarity before they are compared,
+        as the keyword engine adds them to its base confidences.
+        """
+        scores = self._scores(text)
+        best_intent, best_score = None, 0.0
+        for label, similarity in zip(self.labels, scores):
+            if similarity < self.min_similarity:
+                continue
+            score = float(similarity) + (boosts.get(label, 0.0) if boosts else 0.0)
+            if best_intent is None or score > best_score:
+                best_intent, best_score = label, score
+
+        if best_intent is None:
+            return {"intent": self.default_intent, "confidence": self.default_confidence}
+        return {"intent": best_intent, "confidence": round(min(best_score, max_confidence), 4)}
+
+
+def intent_examples(
+    training_data: Dict,
+    section: str = "intent_examples",
+    labels: Optional[Dict[str, str]] = None
+) -> Dict[str, List[str]]:
+    """Examples per intent from a training data section, optionally relabelled through labels"""
+    examples: Dict[str, List[str]] = {}
+    for entry in training_data.get(section, []):
+        intent = (labels or {}).get(entry["intent"], entry["intent"])
+        examples.setdefault(intent, []).extend(entry.get("examples", []))
+    return examples
+
+
+def build_centroid_classifier(
+    training_data: Dict,
+    nlp,
+    min_similarity: Optional[float] = None,
+    examples: Optional[Dict[str, List[str]]] = None
+) -> CentroidIntentClassifier:
+    """Centroid classifier over examples (default: the training intent examples), embedded with nlp's vectors"""
+    if min_similarity is None:
+        min_similarity = nlu_config.INTENT_MIN_SIMILARITY
+    if examples is None:
+        examples = intent_examples(training_data)
+    return CentroidIntentClassifier(examples, nlp.vectors, min_similarity=min_similarity)
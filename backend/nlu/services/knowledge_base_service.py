@@ -7,12 +7,16 @@ Integrates repair knowledge base with device recognition and NLU processing
 import json
 import logging
 import time
-from typing import Dict, List, Optional, Tuple, Any
-import psycopg2
+from typing import Dict, List, Optional, Set, Tuple, Any, Union
 from psycopg2.extras import RealDictCursor
 import difflib
 from datetime import datetime
 
+import nlu_config
+import db_pool
+from nlu_cache import InstrumentedTTLCache
+from procedure_changes import ProcedureChangeListener
+
 # Suppress initialization output for clean API communication
 logging.basicConfig(level=logging.ERROR, format='%(levelname)s: %(message)s')
 logger = logging.getLogger(__name__)
@@ -22,43 +26,114 @@ class KnowledgeBaseService:
     Advanced knowledge base service for repair procedure recommendations
     """
     
+    # Procedures returned per search, and steps previewed per procedure
+    RESULT_LIMIT = 5
+    STEPS_PREVIEW_LIMIT = 3
+    
+    # Steps preview, step count and feedback summary per procedure, for (ids, preview limit)
+    PROCEDURE_DETAILS_QUERY = """
+    SELECT p.id,
+           COALESCE(steps.preview, '[]'::json) as steps_preview,
+           step_counts.total_steps,
+           feedback.avg_rating,
+           feedback.feedback_count,
+           feedback.avg_actual_time,
+           feedback.success_count
+    FROM unnest(%s::int[]) AS p(id)
+    CROSS JOIN LATERAL (
+        SELECT json_agg(s ORDER BY s.step_number) as preview
+        FROM (
+            SELECT step_number, title, description, estimated_duration_minutes, 
+                   difficulty_rating, caution_level, tips_and_tricks
+            FROM procedure_steps 
+            WHERE procedure_id = p.id 
+            ORDER BY step_number
+            LIMIT %s
+        ) s
+    ) steps
+    CROSS JOIN LATERAL (
+        SELECT COUNT(*) as total_steps
+        FROM procedure_steps
+        WHERE procedure_id = p.id
+    ) step_counts
+    CROSS JOIN LATERAL (
+        SELECT AVG(rating) as avg_rating, 
+               COUNT(*) as feedback_count,
+               AVG(actual_time_minutes) as avg_actual_time,
+               COUNT(CASE WHEN was_successful THEN 1 END) as success_count
+        FROM procedure_feedback 
+        WHERE procedure_id = p.id
+    ) feedback
+    """
+    
     def __init__(self):
-        """Initialize knowledge base service with database connection"""
-        self.db_config = {
-            'host': 'revivatech_new_database',
-            'port': 5432,
-            'database': 'revivatech_new',
-            'user': 'revivatech_user',
-            'password': 'revivatech_password'
-        }
-        self.connection = None
-        self._connect_database()
+        """Initialize knowledge base service on the shared connection pool"""
+        self.db_config = db_pool.database_config()
+        # Opens the pool's min_size connections unless another service already did
+        db_pool.get_shared_pool()
         
         # Performance tracking
         self.query_count = 0
         self.total_response_time = 0
-        self.cache = {}
+        # Matched procedure rows per search criteria (see _search_procedures_cached)
+        self.cache: Optional[InstrumentedTTLCache] = None
+        if nlu_config.KB_CACHE_ENABLED or nlu_config.KB_CACHE_LISTEN:
+            self.cache = InstrumentedTTLCache(maxsize=nlu_config.KB_CACHE_MAXSIZE, ttl=nlu_config.KB_CACHE_TTL)
+        # Detected on first search (see _has_search_vector)
+        self._search_vector_available: Optional[bool] = None
+        
+        # Hot queries run as prepared statements, keyed by statement name
+        self.use_prepared_statements = nlu_config.DB_PREPARED_STATEMENTS
+        self.prepared_statements: Dict[str, db_pool.PreparedStatement] = {}
+        
+        # Drops cached procedure rows whenever procedures change (NOTIFY from migration 008)
+        self.change_listener: Optional[ProcedureChangeListener] = None
+        if self.cache is not None and nlu_config.KB_CACHE_LISTEN:
+            self.change_listener = ProcedureChangeListener(self.db_config, self._procedures_changed)
+            self.change_listener.start()
         
         logger.error("✅ Knowledge Base Service initialized")
     
-    def _connect_database(self):
-        """Establish database connection"""
-        try:
-            self.connection = psycopg2.connect(**self.db_config)
-            logger.error("📊 Database connection established")
-        except Exception as e:
-            logger.error(f"❌ Database connection failed: {e}")
-            self.connection = None
-    
-    def _execute_query(self, query: str, params: Tuple = None) -> List[Dict]:
+    @property
+    def pool(self) -> db_pool.ConnectionPool:
+        """Process-wide connection pool (shared with every other service in the process)"""
+        return db_pool.get_shared_pool()
+
+    def close(self):
+        """Close the shared pool's connections (e.g. in a parent process before forking workers)"""
+        if self.change_listener is not None:
+            self.change_listener.stop()
+        db_pool.close_shared_pool()
+
+    def reconnect(self):
+        """Drop any inherited connections and open a fresh pool owned by this process"""
+        self.close()
+        db_pool.get_shared_pool()
+        if self.change_listener is not None:
+            self.change_listener.start()
+
+    def _execute_query(self, query: str, params: Union[Tuple, Dict] = None) -> List[Dict]:
         """Execute database query with error handling"""
-        if not self.connection:
-            self._connect_database()
-        
+        return self._fetch_all(lambda cursor: cursor.execute(query, params))
+
+    def _execute_prepared(self, name: str, query: str, params: Union[Tuple, Dict] = None) -> List[Dict]:
+        """Execute a hot query as a named prepared statement (plain query if disabled)"""
+        if not self.use_prepared_statements:
+            return self._execute_query(query, params)
+        statement = self.prepared_statements.get(name)
+        if statement is None:
+            statement = self.prepared_statements[name] = db_pool.PreparedStatement(name, query)
+        return self._fetch_all(lambda cursor: statement.execute(cursor, params))
+
+    def _fetch_all(self, execute) -> List[Dict]:
+        """Run execute(cursor) on a pooled connection and return the rows as dicts"""
         try:
-            with self.connection.cursor(cursor_factory=RealDictCursor) as cursor:
-                cursor.execute(query, params)
-                return [dict(row) for row in cursor.fetchall()]
+            with self.pool.connection() as connection:
+                with connection.cursor(cursor_factory=RealDictCursor) as cursor:
+                    execute(cursor)
+                    if cursor.description is None:
+                        return []
+                    return [dict(row) for row in cursor.fetchall()]
         except Exception as e:
             logger.error(f"Query error: {e}")
             return []
@@ -78,7 +153,7 @@ class KnowledgeBaseService:
         search_criteria = self._build_search_criteria(device_info, problem_info, search_text)
         
         # Execute search queries
-        procedures = self._search_procedures_database(search_criteria)
+        procedures = self._search_procedures_cached(search_criteria)
         
         # Rank and score results
         ranked_procedures = self._rank_procedures(procedures, device_info, problem_info)
@@ -127,73 +202,135 @@ class KnowledgeBaseService:
         
         return criteria
     
-    def _search_procedures_database(self, criteria: Dict) -> List[Dict]:
-        """Execute database search with multiple matching strategies"""
-        
-        # Strategy 1: Exact device and problem match
-        exact_match_query = """
-        SELECT rp.*, 
-               ts_rank(to_tsvector('english', rp.title || ' ' || rp.description || ' ' || COALESCE(rp.overview, '')), 
-                       plainto_tsquery('english', %s)) as search_rank
-        FROM repair_procedures rp
-        WHERE rp.status = %s
-          AND (rp.device_compatibility->>'brands')::jsonb ? %s
-          AND (%s = ANY(rp.problem_categories) OR %s = ANY(rp.diagnostic_tags))
-        ORDER BY search_rank DESC, rp.quality_score DESC NULLS LAST
-        LIMIT 10
-        """
-        
-        search_terms = ' '.join(criteria['search_keywords'])
-        exact_results = self._execute_query(
-            exact_match_query, 
-            (search_terms, criteria['status_filter'], criteria['device_brand'], 
-             criteria['problem_category'], criteria['problem_issue'])
-        )
-        
-        # Strategy 2: Fuzzy device match with problem keywords
-        fuzzy_match_query = """
-        SELECT rp.*, 
-               ts_rank(to_tsvector('english', rp.title || ' ' || rp.description || ' ' || COALESCE(rp.overview, '')), 
-                       plainto_tsquery('english', %s)) as search_rank,
-               'fuzzy_match' as match_type
-        FROM repair_procedures rp
-        WHERE rp.status = %s
-          AND to_tsvector('english', rp.title || ' ' || rp.description) @@ plainto_tsquery('english', %s)
-        ORDER BY search_rank DESC, rp.quality_score DESC NULLS LAST
-        LIMIT 15
-        """
-        
-        fuzzy_results = self._execute_query(
-            fuzzy_match_query,
-            (search_terms, criteria['status_filter'], search_terms)
+    def _cached(self, key: str, load):
+        """load() through the procedure cache, bypassed while changes could go unnoticed"""
+        cache = self.cache
+        if cache is None or (self.change_listener is not None and not self.change_listener.listening):
+            return load()
+        value = cache.get(key)
+        if value is None:
+            value = load()
+            # Failed queries also come back empty, so only real matches are cached. The
+            # value goes into the cache this lookup started with: if a change replaced
+            # that cache during load(), the possibly stale rows are dropped along with it
+            if value:
+                cache[key] = value
+        return value
+    
+    def _search_procedures_cached(self, criteria: Dict) -> List[Dict]:
+        """Database search through the procedure cache; ranking mutates rows, so hits are copied"""
+        cache_key = 'search:' + json.dumps(criteria, sort_keys=True)
+        rows = self._cached(cache_key, lambda: self._search_procedures_database(criteria))
+        return [dict(row) for row in rows]
+    
+    def _procedures_changed(self, procedure_ids: Optional[Set[int]]):
+        """Change listener callback: cached rows may now be stale, so start a new cache"""
+        # Swapped rather than cleared, since a request thread may be using the old one
+        if self.cache is not None:
+            stats = self.cache.stats
+            self.cache = InstrumentedTTLCache(maxsize=nlu_config.KB_CACHE_MAXSIZE, ttl=nlu_config.KB_CACHE_TTL)
+            self.cache.stats = stats
+    
+    def _has_search_vector(self) -> bool:
+        """Whether repair_procedures has the stored search_vector column (migration 006)"""
+        if self._search_vector_available is None:
+            rows = self._execute_query("""
+            SELECT EXISTS (
+                SELECT 1 FROM information_schema.columns
+                WHERE table_name = 'repair_procedures' AND column_name = 'search_vector'
+                  AND table_schema = ANY(current_schemas(false))
+            ) as present
+            """)
+            # No row means the query failed; detect again next time
+            if not rows:
+                return False
+            self._search_vector_available = rows[0]['present']
+        return self._search_vector_available
+    
+    @staticmethod
+    def _search_procedures_sql(search_vector: bool) -> str:
+        """Procedure search statement, on the stored search_vector column when it exists"""
+        if search_vector:
+            rank_document = "rp.search_vector"
+            match_document = "rp.search_vector"
+        else:
+            rank_document = "to_tsvector('english', rp.title || ' ' || rp.description || ' ' || COALESCE(rp.overview, ''))"
+            match_document = "to_tsvector('english', rp.title || ' ' || rp.description)"
+        
+        # Strategy 1: exact device and problem match; 2: full-text match on the
+        # search keywords; 3: generic procedures for the device type. Each
+        # strategy numbers its matches on narrow (id, rank) rows, a procedure
+        # found by several strategies is kept once under the earliest one (ties
+        # within a strategy go by id, so results are deterministic), and
+        # only the final rows are joined back to repair_procedures, listed
+        # strategy 1, then 2, then 3.
+        return f"""
+        WITH exact_match AS (
+            SELECT id, search_rank, 'exact_match' as match_type, 1 as strategy,
+                   row_number() OVER (ORDER BY search_rank DESC, quality_score DESC NULLS LAST, id) as strategy_position
+            FROM (
+                SELECT rp.id, rp.quality_score,
+                       ts_rank({rank_document}, plainto_tsquery('english', %(search_terms)s)) as search_rank
+                FROM repair_procedures rp
+                WHERE rp.status = %(status)s
+                  AND rp.device_compatibility->'brands' ? %(device_brand)s
+                  AND (%(problem_category)s = ANY(rp.problem_categories) OR %(problem_issue)s = ANY(rp.diagnostic_tags))
+            ) matches
+        ), fuzzy_match AS (
+            SELECT id, search_rank, 'fuzzy_match' as match_type, 2 as strategy,
+                   row_number() OVER (ORDER BY search_rank DESC, quality_score DESC NULLS LAST, id) as strategy_position
+            FROM (
+                SELECT rp.id, rp.quality_score,
+                       ts_rank({rank_document}, plainto_tsquery('english', %(search_terms)s)) as search_rank
+                FROM repair_procedures rp
+                WHERE rp.status = %(status)s
+                  AND {match_document} @@ plainto_tsquery('english', %(search_terms)s)
+            ) matches
+        ), generic_match AS (
+            SELECT rp.id, 0.5::real as search_rank, 'generic_match' as match_type, 3 as strategy,
+                   row_number() OVER (ORDER BY rp.quality_score DESC NULLS LAST, rp.view_count DESC, rp.id) as strategy_position
+            FROM repair_procedures rp
+            WHERE rp.status = %(status)s
+              AND rp.device_compatibility->'types' ? %(device_type)s
+        ), best AS (
+            SELECT DISTINCT ON (id) * FROM (
+                SELECT * FROM exact_match WHERE strategy_position <= 10
+                UNION ALL
+                SELECT * FROM fuzzy_match WHERE strategy_position <= 15
+                UNION ALL
+                SELECT * FROM generic_match WHERE strategy_position <= 5
+            ) combined
+            ORDER BY id, strategy, strategy_position
         )
-        
-        # Strategy 3: Generic procedures for device type
-        generic_query = """
-        SELECT rp.*, 0.5 as search_rank, 'generic_match' as match_type
-        FROM repair_procedures rp
-        WHERE rp.status = %s
-          AND (rp.device_compatibility->>'types')::jsonb ? %s
-        ORDER BY rp.quality_score DESC NULLS LAST, rp.view_count DESC
-        LIMIT 5
+        SELECT rp.*, best.search_rank, best.match_type
+        FROM best
+        JOIN repair_procedures rp ON rp.id = best.id
+        ORDER BY best.strategy, best.strategy_position
         """
-        
-        generic_results = self._execute_query(
-            generic_query,
-            (criteria['status_filter'], criteria['device_type'])
+    
+    @staticmethod
+    def _search_procedures_params(criteria: Dict) -> Dict[str, Any]:
+        return {
+            'search_terms': ' '.join(criteria['search_keywords']),
+            'status': criteria['status_filter'],
+            'device_brand': criteria['device_brand'],
+            'device_type': criteria['device_type'],
+            'problem_category': criteria['problem_category'],
+            'problem_issue': criteria['problem_issue']
+        }
+    
+    def _search_procedures_database(self, criteria: Dict) -> List[Dict]:
+        """Execute database search with multiple matching strategies in one round trip"""
+        search_vector = self._has_search_vector()
+        results = self._execute_prepared(
+            'kb_search_procedures_vector' if search_vector else 'kb_search_procedures',
+            self._search_procedures_sql(search_vector),
+            self._search_procedures_params(criteria)
         )
         
-        # Combine and deduplicate results
-        all_results = exact_results + fuzzy_results + generic_results
-        seen_ids = set()
-        unique_results = []
-        
-        for result in all_results:
-            if result['id'] not in seen_ids:
-                seen_ids.add(result['id'])
-                unique_results.append(result)
-        
-        return unique_results
+        for result in results:
+            result.pop('search_vector', None)
+        return results
     
     def _rank_procedures(
         self, 
@@ -311,32 +448,25 @@ class KnowledgeBaseService:
         
         return min(score, 1.0)
     
+    def _fetch_procedure_details(self, procedure_ids: List[int]) -> Dict[int, Dict]:
+        """Steps preview, step count and feedback summary for several procedures in one round trip"""
+        if not procedure_ids:
+            return {}
+        
+        cache_key = 'details:' + ','.join(str(procedure_id) for procedure_id in procedure_ids)
+        rows = self._cached(cache_key, lambda: self._execute_prepared(
+            'kb_procedure_details', self.PROCEDURE_DETAILS_QUERY, (list(procedure_ids), self.STEPS_PREVIEW_LIMIT)
+        ))
+        return {row['id']: dict(row) for row in rows}
+    
     def _enhance_procedure_results(self, procedures: List[Dict]) -> List[Dict]:
         """Add detailed information to procedure results"""
         enhanced = []
+        top_procedures = procedures[:self.RESULT_LIMIT]
+        details = self._fetch_procedure_details([procedure['id'] for procedure in top_procedures])
         
-        for procedure in procedures[:5]:  # Limit to top 5 results
-            # Get procedure steps
-            steps_query = """
-            SELECT step_number, title, description, estimated_duration_minutes, 
-                   difficulty_rating, caution_level, tips_and_tricks
-            FROM procedure_steps 
-            WHERE procedure_id = %s 
-            ORDER BY step_number
-            """
-            steps = self._execute_query(steps_query, (procedure['id'],))
-            
-            # Get feedback summary
-            feedback_query = """
-            SELECT AVG(rating) as avg_rating, 
-                   COUNT(*) as feedback_count,
-                   AVG(actual_time_minutes) as avg_actual_time,
-                   COUNT(CASE WHEN was_successful THEN 1 END) as success_count
-            FROM procedure_feedback 
-            WHERE procedure_id = %s
-            """
-            feedback = self._execute_query(feedback_query, (procedure['id'],))
-            feedback_summary = feedback[0] if feedback else {}
+        for procedure in top_procedures:
+            procedure_details = details.get(procedure['id'], {})
             
             enhanced_procedure = {
                 'id': procedure['id'],
@@ -355,11 +485,11 @@ class KnowledgeBaseService:
                     'quality_score': procedure.get('quality_score'),
                     'success_rate': procedure.get('success_rate'),
                     'view_count': procedure.get('view_count', 0),
-                    'avg_rating': float(feedback_summary.get('avg_rating', 0)) if feedback_summary.get('avg_rating') else None,
-                    'feedback_count': feedback_summary.get('feedback_count', 0)
+                    'avg_rating': float(procedure_details['avg_rating']) if procedure_details.get('avg_rating') else None,
+                    'feedback_count': procedure_details.get('feedback_count', 0)
                 },
-                'steps_preview': steps[:3],  # First 3 steps as preview
-                'total_steps': len(steps),
+                'steps_preview': procedure_details.get('steps_preview', []),
+                'total_steps': procedure_details.get('total_steps', 0),
                 'estimated_cost': self._estimate_procedure_cost(procedure),
                 'recommendation_reason': self._generate_recommendation_reason(procedure)
             }
@@ -475,7 +605,8 @@ class KnowledgeBaseService:
         problem_category = problem_info.get('category', '')
         problem_issue = problem_info.get('issue', '')
         
-        diagnostic_rules = self._execute_query(
+        diagnostic_rules = self._execute_prepared(
+            'kb_diagnostic_rules',
             rules_query, 
             (device_type, problem_category, problem_issue)
         )
@@ -490,7 +621,7 @@ class KnowledgeBaseService:
                 FROM repair_procedures 
                 WHERE id = ANY(%s) AND status = 'published'
                 """
-                procedures = self._execute_query(procedures_query, (procedure_ids,))
+                procedures = self._execute_prepared('kb_rule_procedures', procedures_query, (procedure_ids,))
                 
                 recommendations.append({
                     'rule_name': rule['rule_name'],
@@ -506,6 +637,20 @@ class KnowledgeBaseService:
             'confidence_level': 'high' if recommendations else 'medium'
         }
     
+    def get_performance_stats(self) -> Dict[str, Any]:
+        """Query timings and procedure cache counters"""
+        return {
+            'total_queries': self.query_count,
+            'avg_response_time_ms': round(self.total_response_time / self.query_count, 2) if self.query_count else 0.0,
+            'procedure_cache': self.cache.get_stats() if self.cache is not None else None,
+            'connection_pool': self.pool.get_stats(),
+            'prepared_statements': {
+                name: {**statement.stats, 'prepare_ms': round(statement.stats['prepare_ms'], 2)}
+                for name, statement in self.prepared_statements.items()
+            },
+            'procedure_changes': self.change_listener.get_stats() if self.change_listener is not None else None
+        }
+    
     def log_knowledge_base_interaction(
         self, 
         search_query: str, 
@@ -527,13 +672,12 @@ class KnowledgeBaseService:
             problem_string = f"{problem_info.get('category', '')} - {problem_info.get('issue', '')}".strip()
             session_id = f"kb_{int(time.time())}"
             
-            self._execute_query(
+            self._execute_prepared(
+                'kb_log_interaction',
                 log_query,
                 ('search', search_query, device_string, problem_string, 
                  response_time_ms, len(results), session_id)
             )
-            
-            self.connection.commit()
         except Exception as e:
             logger.error(f"Failed to log interaction: {e}")
 
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+RevivaTech N-gram Index
+Character n-gram inverted index used to shortlist device models before fuzzy scoring.
+
+Scoring a message against every model with partial_ratio is linear in the
+catalogue size. The index maps each character trigram to the models that
+contain it, so a lookup only touches the posting lists of the message's own
+trigrams and hands a small candidate set to the fuzzy scorer.
+"""
+
+import re
+import heapq
+from collections import Counter
+from typing import Dict, Iterable, List, Set
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+
+def normalise(text: str) -> str:
+    """Lowercase and collapse everything that is not a letter/digit to single spaces"""
+    return _NON_ALNUM.sub(" ", text.lower()).strip()
+
+
+def ngrams(text: str, n: int = 3) -> Set[str]:
+    """Distinct character n-grams of the normalised text, padded so word edges count"""
+    padded = f" {normalise(text)} "
+    if len(padded) < n:
+        return {padded}
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+
+class NGramIndex:
+    """
+    Inverted index from character n-grams to catalogue entries.
+
+    Candidates are ranked by how much of the entry's n-gram set appears in the
+    query (the n-gram analogue of partial_ratio, which aligns the shorter model
+    name inside the longer message). Grams shared by more than max_posting_ratio
+    of the catalogue carry no signal and are skipped at lookup time, which keeps
+    lookups roughly flat as the catalogue grows.
+    """
+
+    def __init__(self, items: Iterable[str] = (), n: int = 3, max_posting_ratio: float = 0.01):
+        self.n = n
+        self.max_posting_ratio = max_posting_ratio
+        self.items: List[str] = []
+        self._gram_counts: List[int] = []
+        self._postings: Dict[str, List[int]] = {}
+        self.add_all(items)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def add_all(self, items: Iterable[str]):
+        for item in items:
+            self.add(item)
+
+    def add(self, item: str):
+        """Index one entry; ids follow insertion order so ties keep catalogue order"""
+        item_id = len(self.items)
+        grams = ngrams(item, self.n)
+        self.items.append(item)
+        self._gram_counts.append(len(grams))
+        for gram in grams:
+            self._postings.setdefault(gram, []).append(item_id)
+
+    def candidates(self, query: str, limit: int = 50) -> List[str]:
+        """Up to limit entries sharing the most n-grams with query, in catalogue order"""
+        max_postings = max(limit, int(len(self.items) * self.max_posting_ratio))
+
+        shared = Counter()
+        for gram in ngrams(query, self.n):
+            posting = self._postings.get(gram)
+            if posting and len(posting) <= max_postings:
+                shared.update(posting)
+
+        if not shared:
+            return []
+
+        gram_counts = self._gram_counts
+        best = heapq.nlargest(limit, shared.items(), key=lambda entry: entry[1] / gram_counts[entry[0]])
+        return [self.items[item_id] for item_id in sorted(item_id for item_id, _ in best)]
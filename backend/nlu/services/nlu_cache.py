@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+RevivaTech NLU Result Cache
+Bounded cache of whole NLU results for repeated chat messages.
+
+Chat widgets send the same canned phrases over and over; caching the complete
+process_message_enhanced result skips problem extraction, intent scoring,
+severity assessment and insight lookup for them. Entries are kept as dicts
+with an approximate size, so a hit costs a shallow copy rather than a decode.
+
+InstrumentedTTLCache is the in-process TTLCache used by the device matcher and
+the knowledge base, extended with the same hit/miss/eviction/expiration
+counters so every cache reports through one get_stats() shape.
+"""
+
+import re
+import sys
+import time
+import random
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from itertools import islice
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from cachetools import TTLCache
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalise_message(message: str) -> str:
+    """Lowercase and collapse whitespace so trivially different messages share a key"""
+    return _WHITESPACE.sub(" ", message).strip().lower()
+
+
+def approximate_size(obj: Any, _seen: Optional[set] = None) -> int:
+    """Rough deep size in bytes of plain containers and simple objects"""
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(approximate_size(k, _seen) + approximate_size(v, _seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(approximate_size(item, _seen) for item in obj)
+    elif hasattr(obj, "__dict__"):
+        size += approximate_size(vars(obj), _seen)
+    return size
+
+
+# Chat traffic repeats a small set of user agents, so their hashes are memoised
+@lru_cache(maxsize=1024)
+def user_agent_fingerprint(user_agent: Optional[str]) -> str:
+    """Short stable fingerprint of a user agent ("" when there is none)"""
+    if not user_agent:
+        return ""
+    return hashlib.blake2b(user_agent.strip().encode("utf-8"), digest_size=8).hexdigest()
+
+
+class ResultCache:
+    """
+    LRU cache with a TTL and a total size limit in bytes.
+
+    Results are kept as dicts and sized with approximate_size when stored;
+    least recently used entries are evicted until the total fits in
+    max_bytes, and entries older than ttl seconds are dropped when they are
+    next looked up or reach the LRU end. Stores and hits copy the result and
+    each of its top-level dict sections, so callers can set keys at either
+    level; anything nested deeper is shared and must not be modified.
+    """
+
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024, ttl: float = 300.0,
+                 timer: Callable[[], float] = time.monotonic):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._timer = timer
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any], int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expirations": 0, "rejected": 0}
+
+    @staticmethod
+    def make_key(message: str, user_agent: Optional[str] = None) -> str:
+        return f"{user_agent_fingerprint(user_agent)}|{normalise_message(message)}"
+
+    @staticmethod
+    def _copy(result: Dict[str, Any]) -> Dict[str, Any]:
+        return {key: dict(value) if type(value) is dict else value for key, value in result.items()}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _drop(self, key: str):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """A copy of the cached result, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            if entry[0] <= self._timer():
+                self._drop(key)
+                self.stats["expirations"] += 1
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            result = entry[1]
+        return self._copy(result)
+
+    def put(self, key: str, result: Dict[str, Any]):
+        """Store a copy of a result (replacing any previous entry for the key)"""
+        result = self._copy(result)
+        size = approximate_size(result)
+        if size > self.max_bytes:
+            self.stats["rejected"] += 1
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (self._timer() + self.ttl, result, size)
+            self._bytes += size
+            self.stats["stores"] += 1
+
+            now = self._timer()
+            while self._bytes > self.max_bytes:
+                oldest_key, (expires_at, _, _) = next(iter(self._entries.items()))
+                self._drop(oldest_key)
+                self.stats["expirations" if expires_at <= now else "evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl
+        }
+
+
+class InstrumentedTTLCache(TTLCache):
+    """
+    cachetools TTLCache that counts hits, misses, evictions and expirations.
+
+    Evictions are entries dropped to make room (least recently used first);
+    expirations are entries dropped because their TTL ran out. Memory use is
+    estimated from a sample of at most size_sample entries when stats are read,
+    so lookups and stores cost the same as a plain TTLCache.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, timer: Callable[[], float] = time.monotonic,
+                 size_sample: int = 64):
+        super().__init__(maxsize=maxsize, ttl=ttl, timer=timer)
+        self.size_sample = size_sample
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expirations": 0}
+
+    def __getitem__(self, key):
+        try:
+            value = super().__getitem__(key)
+        except KeyError:
+            self.stats["misses"] += 1
+            raise
+        self.stats["hits"] += 1
+        return value
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        self.stats["misses"] += 1
+        return default
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.stats["stores"] += 1
+
+    def popitem(self):
+        # TTLCache.popitem reads the victim through self[key]; that is not a lookup
+        hits = self.stats["hits"]
+        item = super().popitem()
+        self.stats["hits"] = hits
+        self.stats["evictions"] += 1
+        return item
+
+    def expire(self, time=None):
+        expired = super().expire(time)
+        self.stats["expirations"] += len(expired)
+        return expired
+
+    def approximate_bytes(self) -> int:
+        """Estimated memory held by the cached keys and values"""
+        entries = len(self)
+        if not entries:
+            return 0
+        start = random.randrange(entries - self.size_sample + 1) if entries > self.size_sample else 0
+        sample = list(islice(iter(self), start, start + self.size_sample))
+        # Read through TTLCache directly so sampling does not count as hits
+        sampled = sum(approximate_size(key) + approximate_size(TTLCache.__getitem__(self, key)) for key in sample)
+        return int(sampled * entries / len(sample))
+
+    def get_stats(self) -> Dict[str, Any]:
+        self.expire()
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+            "entries": len(self),
+            "maxsize": self.maxsize,
+            "bytes": self.approximate_bytes(),
+            "ttl_seconds": self.ttl
+        }
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+RevivaTech NLU Runtime Configuration
+Settings are read from environment variables so deployments can tune the
+NLU services without code changes; every setting has a safe default.
+"""
+
+import os
+from typing import List, Optional
+
+
+def get_str(name: str, default: Optional[str] = None) -> Optional[str]:
+    """Read a string setting"""
+    value = os.environ.get(name)
+    return value if value not in (None, "") else default
+
+
+def get_int(name: str, default: int) -> int:
+    """Read an integer setting, falling back to the default on bad input"""
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def get_float(name: str, default: float) -> float:
+    """Read a float setting, falling back to the default on bad input"""
+    try:
+        return float(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def get_bool(name: str, default: bool) -> bool:
+    """Read a boolean setting (1/true/yes/on)"""
+    value = os.environ.get(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def get_list(name: str, default: List[str]) -> List[str]:
+    """Read a comma-separated list setting"""
+    value = os.environ.get(name)
+    if value is None:
+        return list(default)
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+# spaCy model and the pipeline components to enable ("all" keeps the full pipeline)
+SPACY_MODEL = get_str("NLU_SPACY_MODEL", "en_core_web_md")
+SPACY_COMPONENTS = get_list("NLU_SPACY_COMPONENTS", ["ner"])
+# Load the spaCy model in a background thread at start-up instead of on first use
+SPACY_PRELOAD = get_bool("NLU_SPACY_PRELOAD", False)
+
+# Intent classifier: "keyword" (pattern tables) or "centroid" (intent_examples vectors)
+INTENT_MODE = get_str("NLU_INTENT_MODE", "keyword")
+# Centroid mode falls back to general_inquiry below this cosine similarity
+INTENT_MIN_SIMILARITY = get_float("NLU_INTENT_MIN_SIMILARITY", 0.5)
+
+# Whole-result cache in front of process_message_enhanced
+RESULT_CACHE_ENABLED = get_bool("NLU_RESULT_CACHE_ENABLED", True)
+RESULT_CACHE_MAX_BYTES = get_int("NLU_RESULT_CACHE_MAX_BYTES", 16 * 1024 * 1024)
+RESULT_CACHE_TTL = get_float("NLU_RESULT_CACHE_TTL", 300.0)
+
+# Device/UA match cache: "memory" (per-process TTLCache) or "sqlite" (shared by all workers)
+DEVICE_CACHE_BACKEND = get_str("NLU_DEVICE_CACHE_BACKEND", "memory")
+DEVICE_CACHE_MAXSIZE = get_int("NLU_DEVICE_CACHE_MAXSIZE", 1000)
+DEVICE_CACHE_TTL = get_float("NLU_DEVICE_CACHE_TTL", 300.0)
+DEVICE_CACHE_PATH = get_str("NLU_DEVICE_CACHE_PATH", "/tmp/revivatech_nlu/device_cache.sqlite3")
+DEVICE_CACHE_MAX_BYTES = get_int("NLU_DEVICE_CACHE_MAX_BYTES", 64 * 1024 * 1024)
+
+# Slow user agent parses (Matomo) in a process pool: 0 parses in the request thread
+UA_PARSE_WORKERS = get_int("NLU_UA_PARSE_WORKERS", 0)
+UA_PARSE_DEADLINE_MS = get_float("NLU_UA_PARSE_DEADLINE_MS", 100.0)
+
+# Knowledge base procedure cache (search criteria -> matched rows, ids -> details).
+# With NLU_KB_CACHE_LISTEN (needs migration 008) the cache is on and emptied on
+# every NOTIFY repair_procedures_changed; NLU_KB_CACHE_ENABLED alone keeps
+# entries until their TTL runs out, so it is off by default
+KB_CACHE_ENABLED = get_bool("NLU_KB_CACHE_ENABLED", False)
+KB_CACHE_LISTEN = get_bool("NLU_KB_CACHE_LISTEN", False)
+KB_CACHE_MAXSIZE = get_int("NLU_KB_CACHE_MAXSIZE", 500)
+KB_CACHE_TTL = get_float("NLU_KB_CACHE_TTL", 300.0)
+
+# PostgreSQL connection used by the knowledge base
+DB_HOST = get_str("NLU_DB_HOST", "revivatech_new_database")
+DB_PORT = get_int("NLU_DB_PORT", 5432)
+DB_NAME = get_str("NLU_DB_NAME", "revivatech_new")
+DB_USER = get_str("NLU_DB_USER", "revivatech_user")
+DB_PASSWORD = get_str("NLU_DB_PASSWORD", "revivatech_password")
+DB_CONNECT_TIMEOUT = get_int("NLU_DB_CONNECT_TIMEOUT", 5)
+
+# Process-wide connection pool: size bounds, checkout timeout in seconds, and
+# how long a connection may sit idle before it is re-validated (0 = every borrow;
+# a connection that dies sooner is discarded and replaced when its query fails)
+DB_POOL_MIN_SIZE = get_int("NLU_DB_POOL_MIN_SIZE", 1)
+DB_POOL_MAX_SIZE = get_int("NLU_DB_POOL_MAX_SIZE", 10)
+DB_POOL_TIMEOUT = get_float("NLU_DB_POOL_TIMEOUT", 5.0)
+DB_POOL_VALIDATE_IDLE = get_float("NLU_DB_POOL_VALIDATE_IDLE", 30.0)
+
+# Run the knowledge base's hot queries as per-connection prepared statements
+# (disable behind a transaction-pooling proxy that does not keep sessions)
+DB_PREPARED_STATEMENTS = get_bool("NLU_DB_PREPARED_STATEMENTS", True)
\ No newline at end of file
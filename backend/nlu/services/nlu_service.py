@@ -4,20 +4,84 @@ RevivaTech NLU Service - Custom Natural Language Understanding
 Processes user messages to extract device information and repair intents.
 """
 
-import spacy
 import json
 import re
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, List, Tuple, Optional, Union, Iterable
 import sys
 import os
 
+import nlu_config
+from spacy_pipeline import LazyPipeline
+from pattern_automaton import KeywordAutomaton
+from intent_engine import IntentEngine
+from intent_vectors import build_centroid_classifier, resolve_intent_mode
+
+class MessageAnalysis:
+    """
+    Shared per-request view of a message.
+    
+    The extractors read the lowercased text and, only when pattern matching is
+    not confident enough, the spaCy Doc - which is parsed lazily and at most once.
+    Token-only paths use nlp.make_doc and never run a pipeline component.
+    """
+    
+    def __init__(self, text: str, nlp, doc=None):
+        self.text = text
+        self.text_lower = text.lower()
+        self._nlp = nlp
+        self._doc = doc
+        self._tokens = None
+    
+    @property
+    def doc(self):
+        """spaCy Doc (with entities) for the message, parsed on first access"""
+        if self._doc is None:
+            self._doc = self._nlp(self.text)
+        return self._doc
+    
+    @property
+    def tokens(self) -> List[str]:
+        """Lowercased token texts of the message"""
+        if self._tokens is None:
+            # Tokenizer only - reuse the full Doc if it has already been parsed
+            token_doc = self._doc if self._doc is not None else self._nlp.make_doc(self.text)
+            self._tokens = [token.text.lower() for token in token_doc]
+        return self._tokens
+    
+    @property
+    def is_parsed(self) -> bool:
+        return self._doc is not None
+
 class RevivaTechNLU:
-    def __init__(self, training_data_path: str = "/app/nlu/training_data/device_intents.json"):
-        """Initialize the NLU service with spaCy model and training data."""
+    def __init__(
+        self,
+        training_data_path: str = "/app/nlu/training_data/device_intents.json",
+        spacy_components: Optional[Iterable[str]] = None,
+        preload_model: Optional[bool] = None,
+        intent_mode: Optional[str] = None
+    ):
+        """
+        Initialize the NLU service with spaCy model and training data.
+        
+        spacy_components selects the pipeline components to load (defaults to
+        NLU_SPACY_COMPONENTS, i.e. NER only; pass ["all"] for the full pipeline).
+        The model is loaded on first use; preload_model (default NLU_SPACY_PRELOAD)
+        starts loading it in a background thread right away instead.
+        intent_mode (default NLU_INTENT_MODE) picks the intent classifier:
+        "keyword" pattern tables or "centroid" similarity to the intent_examples.
+        """
         try:
-            # Load spaCy model
-            self.nlp = spacy.load("en_core_web_md")
-            print("✅ spaCy model loaded successfully")
+            # spaCy model with only the components the extractors need, loaded
+            # lazily so pattern-resolvable messages never wait for it
+            self.nlp = LazyPipeline(components=spacy_components)
+            if preload_model is None:
+                preload_model = nlu_config.SPACY_PRELOAD
+            if preload_model:
+                self.nlp.load_in_background()
+            print("✅ spaCy model configured (loads on first use)")
+            
+            # How many requests actually needed the statistical model
+            self.model_usage = {"requests": 0, "model_requests": 0}
             
             # Load training data
             with open(training_data_path, 'r') as f:
@@ -26,6 +90,9 @@ class RevivaTechNLU:
             
             # Build device and problem pattern dictionaries
             self._build_pattern_dictionaries()
+            self.intent_engine = IntentEngine(self._load_intent_patterns())
+            self.intent_mode = resolve_intent_mode(intent_mode)
+            self._centroid_classifier = None
             print("✅ Pattern dictionaries built successfully")
             
         except Exception as e:
@@ -78,26 +145,56 @@ class RevivaTechNLU:
                         "repair_time": problem["repair_time"],
                         "confidence": 0.9
                     }
+        
+        # Compile both dictionaries into Aho-Corasick automata so one pass over
+        # the message finds every pattern. Values carry the dictionary order so
+        # ties resolve exactly like iterating the dictionaries did.
+        self.device_automaton = self._compile_automaton(self.device_patterns)
+        self.problem_automaton = self._compile_automaton(self.problem_patterns)
+
+    @staticmethod
+    def _compile_automaton(patterns: Dict[str, Dict]) -> KeywordAutomaton:
+        """
+        Compile a pattern dictionary into a word-boundary aware automaton.
+        
+        Patterns must start on a word boundary but may end inside a word, so
+        inflections keep matching ("battery drain" in "battery drains").
+        """
+        automaton = KeywordAutomaton(word_boundaries="start")
+        for order, (pattern, info) in enumerate(patterns.items()):
+            automaton.add(pattern, (order, info))
+        return automaton.build()
 
-    def extract_device_info(self, text: str) -> Dict:
-        """Extract device information from user text."""
-        text_lower = text.lower()
-        best_device = None
-        best_confidence = 0.0
+    @staticmethod
+    def _best_automaton_match(automaton: KeywordAutomaton, text_lower: str) -> Tuple[Optional[Dict], float]:
+        """Highest-confidence pattern found in the text (earliest dictionary entry wins ties)."""
+        best = None
+        for order, info in automaton.find_keywords(text_lower).values():
+            if best is None or info["confidence"] > best[1]["confidence"] or \
+                    (info["confidence"] == best[1]["confidence"] and order < best[0]):
+                best = (order, info)
+        
+        if best is None:
+            return None, 0.0
+        return best[1].copy(), best[1]["confidence"]
+
+    def analyse(self, text: Union[str, MessageAnalysis], doc=None) -> MessageAnalysis:
+        """Wrap a message in a MessageAnalysis (no-op if it already is one)."""
+        if isinstance(text, MessageAnalysis):
+            return text
+        return MessageAnalysis(text, self.nlp, doc)
+
+    def extract_device_info(self, text: Union[str, MessageAnalysis]) -> Dict:
+        """Extract device information from user text or a shared MessageAnalysis."""
+        analysis = self.analyse(text)
         
         # Direct pattern matching first (highest confidence)
-        for pattern, device_info in self.device_patterns.items():
-            if pattern in text_lower:
-                if device_info["confidence"] > best_confidence:
-                    best_device = device_info.copy()
-                    best_confidence = device_info["confidence"]
+        best_device, best_confidence = self._match_device_patterns(analysis.text_lower)
         
         # spaCy entity recognition as backup
-        if not best_device or best_confidence < 0.7:
-            doc = self.nlp(text)
-            
+        if self._needs_entities(best_device, best_confidence):
             # Look for organization entities (brands) and product entities
-            for ent in doc.ents:
+            for ent in analysis.doc.ents:
                 if ent.label_ in ["ORG", "PRODUCT"]:
                     ent_lower = ent.text.lower()
                     
@@ -120,23 +217,24 @@ class RevivaTechNLU:
             "confidence": 0.1
         }
 
-    def extract_problem_info(self, text: str) -> Dict:
-        """Extract problem/issue information from user text."""
-        text_lower = text.lower()
-        best_problem = None
-        best_confidence = 0.0
+    def _match_device_patterns(self, text_lower: str) -> Tuple[Optional[Dict], float]:
+        """Best dictionary device match for the text and its confidence."""
+        return self._best_automaton_match(self.device_automaton, text_lower)
+
+    @staticmethod
+    def _needs_entities(best_device: Optional[Dict], best_confidence: float) -> bool:
+        """Whether the device match is weak enough to fall back to spaCy NER."""
+        return not best_device or best_confidence < 0.7
+
+    def extract_problem_info(self, text: Union[str, MessageAnalysis]) -> Dict:
+        """Extract problem/issue information from user text or a shared MessageAnalysis."""
+        analysis = self.analyse(text)
         
         # Direct pattern matching
-        for pattern, problem_info in self.problem_patterns.items():
-            if pattern in text_lower:
-                if problem_info["confidence"] > best_confidence:
-                    best_problem = problem_info.copy()
-                    best_confidence = problem_info["confidence"]
+        best_problem, best_confidence = self._best_automaton_match(self.problem_automaton, analysis.text_lower)
         
         # Keyword-based matching as backup
         if not best_problem or best_confidence < 0.7:
-            doc = self.nlp(text)
-            
             # Look for problem-related keywords
             problem_keywords = {
                 "screen": {"category": "Screen Issues", "issue": "screen_general"},
@@ -146,8 +244,7 @@ class RevivaTechNLU:
                 "broken": {"category": "Hardware Issues", "issue": "hardware_general"}
             }
             
-            for token in doc:
-                token_lower = token.text.lower()
+            for token_lower in analysis.tokens:
                 if token_lower in problem_keywords:
                     if not best_problem or best_confidence < 0.5:
                         keyword_info = problem_keywords[token_lower]
@@ -168,12 +265,9 @@ class RevivaTechNLU:
             "confidence": 0.1
         }
 
-    def classify_intent(self, text: str) -> Dict:
-        """Classify the user's intent from their message."""
-        text_lower = text.lower()
-        
-        # Intent patterns with confidence scores
-        intent_patterns = {
+    def _load_intent_patterns(self) -> Dict[str, Dict]:
+        """Intent patterns with confidence scores (earlier intents win ties)"""
+        return {
             "repair_request": {
                 "patterns": ["fix", "repair", "broken", "not working", "problem", "issue", "help"],
                 "confidence": 0.8
@@ -195,38 +289,44 @@ class RevivaTechNLU:
                 "confidence": 0.7
             }
         }
-        
-        best_intent = "general_inquiry"
-        best_confidence = 0.3
-        
-        for intent, data in intent_patterns.items():
-            for pattern in data["patterns"]:
-                if pattern in text_lower:
-                    if data["confidence"] > best_confidence:
-                        best_intent = intent
-                        best_confidence = data["confidence"]
-        
-        return {
-            "intent": best_intent,
-            "confidence": best_confidence
-        }
 
-    def process_message(self, message: str) -> Dict:
+    @property
+    def centroid_classifier(self):
+        """Embedding-centroid intent classifier, built on first use (needs the spaCy vectors)"""
+        if self._centroid_classifier is None:
+            self._centroid_classifier = build_centroid_classifier(self.training_data, self.nlp)
+        return self._centroid_classifier
+
+    def classify_intent(self, text: str) -> Dict:
+        """Classify the user's intent from their message."""
+        if self.intent_mode == "centroid":
+            return self.centroid_classifier.classify(text)
+        return self.intent_engine.classify(text.lower())
+
+    def process_message(self, message: str, doc=None) -> Dict:
         """
         Main function to process a user message and extract all NLU information.
         
         Args:
             message (str): User's input message
+            doc: Optional spaCy Doc for the message (e.g. produced by nlp.pipe)
             
         Returns:
             Dict: Complete NLU analysis including device, problem, and intent
         """
         try:
+            # One shared analysis per request so spaCy parses the message at most once
+            analysis = self.analyse(message, doc)
+            
             # Extract all information
-            device_info = self.extract_device_info(message)
-            problem_info = self.extract_problem_info(message)
+            device_info = self.extract_device_info(analysis)
+            problem_info = self.extract_problem_info(analysis)
             intent_info = self.classify_intent(message)
             
+            self.model_usage["requests"] += 1
+            if analysis.is_parsed:
+                self.model_usage["model_requests"] += 1
+            
             # Calculate overall confidence
             confidences = [
                 device_info.get("confidence", 0),
@@ -257,6 +357,63 @@ class RevivaTechNLU:
                 "timestamp": self._get_timestamp()
             }
 
+    def process_messages_batch(
+        self,
+        messages: List[str],
+        user_agents: Optional[List[Optional[str]]] = None,
+        batch_size: int = 64,
+        n_process: int = 1
+    ) -> List[Dict]:
+        """
+        Process many messages at once, e.g. to re-tag stored chat history.
+        
+        Messages the device patterns cannot resolve are streamed through
+        nlp.pipe so spaCy batches the model work; the rest never touch the model.
+        
+        Args:
+            messages: User messages to analyse
+            user_agents: Accepted for interface parity with RevivaTechEnhancedNLU
+                (this service does not use user agents)
+            batch_size: Number of texts spaCy buffers per batch
+            n_process: Number of spaCy worker processes
+            
+        Returns:
+            List[Dict]: One process_message result per input, in input order
+        """
+        if user_agents is not None and len(user_agents) != len(messages):
+            raise ValueError("user_agents must have the same length as messages")
+        
+        # Only messages whose device match is weak need entities from the model
+        needs_model = [
+            self._needs_entities(*self._match_device_patterns(message.lower()))
+            for message in messages
+        ]
+        
+        docs = iter([])
+        if any(needs_model):
+            docs = self.nlp.pipe(
+                (message for message, needed in zip(messages, needs_model) if needed),
+                batch_size=batch_size,
+                n_process=n_process
+            )
+        
+        return [
+            self.process_message(message, next(docs) if needed else None)
+            for message, needed in zip(messages, needs_model)
+        ]
+
+    def get_model_usage(self) -> Dict:
+        """Report how many requests needed the spaCy model."""
+        requests = self.model_usage["requests"]
+        model_requests = self.model_usage["model_requests"]
+        return {
+            "requests": requests,
+            "model_requests": model_requests,
+            "model_request_rate": round(model_requests / requests, 3) if requests else 0.0,
+            "intent_mode": self.intent_mode,
+            "spacy": self.nlp.get_stats()
+        }
+
     def _determine_response_type(self, confidence: float, intent: str) -> str:
         """Determine what type of response to generate based on confidence and intent."""
         if confidence > 0.8:
@@ -453,6 +453,8 @@ class RevivaTechPhase3NLU:
             'kb_hit_rate_percent': round(kb_hit_rate, 1),
             'average_response_time_ms': round(avg_response_time, 2),
             'average_confidence': round(avg_confidence, 3),
+            'knowledge_base': self.knowledge_base.get_performance_stats(),
+            'device_cache': self.enhanced_nlu.device_matcher.get_cache_stats(),
             'phase': '3_knowledge_integrated'
         }
 
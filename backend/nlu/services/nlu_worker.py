@@ -0,0 +1,527 @@
+#!/usr/bin/env python3
+"""
+RevivaTech NLU Worker - Persistent JSON-lines daemon
+Loads the NLU service once and serves requests over stdin/stdout or a Unix socket,
+so Node.js no longer pays the spaCy/matcher/database start-up cost per chat message.
+With --workers N the model is loaded once and shared by N pre-forked processes.
+
+Protocol (one JSON object per line in each direction):
+    -> {"id": "42", "type": "process", "message": "...", "user_agent": "...", "context": {...}}
+    <- {"id": "42", "type": "result", "status": "success", "result": {...}}
+    -> {"id": "43", "type": "health"}
+    <- {"id": "43", "type": "health", "status": "ready", ...}
+
+A {"type": "ready"} line is written once the service is loaded (and on every new
+socket connection). Health requests are answered immediately while "process"
+requests queue behind the NLU, so responses may arrive out of order - always
+correlate them by "id".
+"""
+
+import sys
+import os
+import json
+import time
+import gc
+import signal
+import socket
+import argparse
+import threading
+import socketserver
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Any, Callable, Optional, List
+
+# Add the current directory to path for imports
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(current_dir)
+
+
+def _load_phase3():
+    from nlu_service_phase3 import RevivaTechPhase3NLU
+    return RevivaTechPhase3NLU()
+
+
+def _load_enhanced():
+    import nlu_api_enhanced
+    return nlu_api_enhanced.initialize_nlu()
+
+
+def _process_phase3(nlu, message: str, user_agent: str = None, context: Dict = None) -> Dict[str, Any]:
+    return nlu.process_message_with_knowledge(message, user_agent, context)
+
+
+def _process_enhanced(nlu, message: str, user_agent: str = None, context: Dict = None) -> Dict[str, Any]:
+    # Reuse the Phase 2 API wrapper so worker output matches nlu_api_enhanced.py
+    import nlu_api_enhanced
+    return nlu_api_enhanced.process_message_api(message, user_agent, context)
+
+
+# service name -> (loader, handler)
+SERVICES = {
+    "phase3": (_load_phase3, _process_phase3),
+    "enhanced": (_load_enhanced, _process_enhanced),
+}
+
+
+class NLUWorkerRuntime:
+    """Owns the long-lived NLU instance and serialises access to it"""
+
+    def __init__(self, service: str = "phase3"):
+        if service not in SERVICES:
+            raise ValueError(f"Unknown NLU service '{service}' (expected one of {sorted(SERVICES)})")
+
+        self.service = service
+        self._loader, self._handler = SERVICES[service]
+        self.nlu = None
+
+        # The NLU services keep mutable caches and stats, so only one request
+        # runs through them at a time; health checks bypass this queue.
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="nlu-worker")
+
+        self.started_at = time.time()
+        self.load_time_ms = 0.0
+        self.requests_served = 0
+        self.requests_failed = 0
+        self.in_flight = 0
+        self._stats_lock = threading.Lock()
+
+        # Set in pre-forked workers only
+        self.worker_slot = None
+        self.memory_report: Dict[str, Any] = {}
+
+    def load(self):
+        """Load the NLU service once for the lifetime of the worker"""
+        load_start = time.time()
+        self.nlu = self._loader()
+        if self.nlu is None:
+            raise RuntimeError(f"Failed to initialize NLU service '{self.service}'")
+        self.load_time_ms = (time.time() - load_start) * 1000
+
+    def spacy_pipelines(self) -> List[Any]:
+        """Lazily loaded spaCy pipelines owned by the service"""
+        owners = [self.nlu, getattr(self.nlu, "enhanced_nlu", None)]
+        pipelines = [getattr(owner, "nlp", None) for owner in owners if owner is not None]
+        return [pipeline for pipeline in pipelines if hasattr(pipeline, "load_in_background")]
+
+    def device_matchers(self) -> List[Any]:
+        """Device matchers owned by the service (phase3 keeps its matcher on enhanced_nlu)"""
+        owners = [self.nlu, getattr(self.nlu, "enhanced_nlu", None)]
+        matchers = [getattr(owner, "device_matcher", None) for owner in owners if owner is not None]
+        return [matcher for matcher in matchers if matcher is not None]
+
+    def preload_model(self, background: bool = True):
+        """Load the spaCy model now instead of on the first message that needs it"""
+        for pipeline in self.spacy_pipelines():
+            if background:
+                pipeline.load_in_background()
+            else:
+                pipeline.model
+
+    def release_resources(self):
+        """Close database connections and UA worker processes held by the service (before forking)"""
+        knowledge_base = getattr(self.nlu, "knowledge_base", None)
+        if knowledge_base is not None:
+            knowledge_base.close()
+
+        for device_matcher in self.device_matchers():
+            device_matcher.close_user_agent_pool()
+
+    def after_fork(self, worker_slot: int):
+        """Re-initialise per-process state in a freshly forked worker"""
+        self.worker_slot = worker_slot
+        self.started_at = time.time()
+
+        knowledge_base = getattr(self.nlu, "knowledge_base", None)
+        if knowledge_base is not None:
+            knowledge_base.reconnect()
+
+        for device_matcher in self.device_matchers():
+            if device_matcher.user_agent_workers > 0:
+                device_matcher.start_user_agent_pool()
+
+        self.memory_report = read_memory_usage()
+
+    def ready_message(self) -> Dict[str, Any]:
+        message = {
+            "type": "ready",
+            "status": "ready",
+            "service": self.service,
+            "pid": os.getpid(),
+            "load_time_ms": round(self.load_time_ms, 2),
+            "timestamp": datetime.now().isoformat()
+        }
+        if self.worker_slot is not None:
+            message["worker"] = self.worker_slot
+            message["memory"] = self.memory_report
+        return message
+
+    def health(self, request_id: Any = None) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "id": request_id,
+                "type": "health",
+                "status": "ready" if self.nlu is not None else "loading",
+                "service": self.service,
+                "pid": os.getpid(),
+                "uptime_s": round(time.time() - self.started_at, 1),
+                "requests_served": self.requests_served,
+                "requests_failed": self.requests_failed,
+                "in_flight": self.in_flight,
+                "worker": self.worker_slot,
+                "memory": read_memory_usage(),
+                "timestamp": datetime.now().isoformat()
+            }
+
+    def process(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Run a single process request through the NLU service"""
+        request_id = request.get("id")
+        message = request.get("message")
+
+        if not isinstance(message, str) or not message.strip():
+            with self._stats_lock:
+                self.requests_failed += 1
+            return self._error(request_id, "Message is required and must be a non-empty string")
+
+        start_time = time.time()
+        try:
+            result = self._handler(self.nlu, message, request.get("user_agent"), request.get("context"))
+        except Exception as e:
+            with self._stats_lock:
+                self.requests_failed += 1
+            return self._error(request_id, str(e))
+
+        with self._stats_lock:
+            self.requests_served += 1
+
+        return {
+            "id": request_id,
+            "type": "result",
+            "status": "success",
+            "result": result,
+            "worker_time_ms": round((time.time() - start_time) * 1000, 2)
+        }
+
+    def submit(self, request: Dict[str, Any], respond: Callable[[Dict[str, Any]], None]):
+        """Queue a process request; `respond` is called from the NLU thread"""
+        with self._stats_lock:
+            self.in_flight += 1
+
+        def run():
+            try:
+                response = self.process(request)
+            finally:
+                with self._stats_lock:
+                    self.in_flight -= 1
+            respond(response)
+
+        self.executor.submit(run)
+
+    def _error(self, request_id: Any, error: str) -> Dict[str, Any]:
+        return {
+            "id": request_id,
+            "type": "error",
+            "status": "error",
+            "error": error,
+            "timestamp": datetime.now().isoformat()
+        }
+
+
+class JSONLineWriter:
+    """Thread-safe writer emitting one compact JSON document per line"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._lock = threading.Lock()
+
+    def write(self, payload: Dict[str, Any]):
+        line = json.dumps(payload, ensure_ascii=False, separators=(',', ':'), default=str)
+        with self._lock:
+            try:
+                self.stream.write(line + "\n")
+                self.stream.flush()
+            except (BrokenPipeError, ValueError, OSError):
+                # Client went away - nothing left to deliver to
+                pass
+
+
+def serve_stream(runtime: NLUWorkerRuntime, reader, writer: JSONLineWriter) -> bool:
+    """
+    Serve JSON-lines requests from `reader` until EOF or a shutdown request.
+
+    Returns True if a shutdown was requested.
+    """
+    for raw_line in reader:
+        line = raw_line.strip()
+        if not line:
+            continue
+
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("request must be a JSON object")
+        except ValueError as e:
+            writer.write(runtime._error(None, f"Invalid request: {e}"))
+            continue
+
+        request_type = request.get("type", "process")
+
+        if request_type in ("health", "ping"):
+            writer.write(runtime.health(request.get("id")))
+        elif request_type == "process":
+            runtime.submit(request, writer.write)
+        elif request_type == "shutdown":
+            writer.write({"id": request.get("id"), "type": "shutdown", "status": "stopping"})
+            return True
+        else:
+            writer.write(runtime._error(request.get("id"), f"Unknown request type '{request_type}'"))
+
+    return False
+
+
+def serve_stdio(runtime: NLUWorkerRuntime, protocol_out, preload_model: bool = False):
+    """Serve requests on stdin, writing responses to the original stdout"""
+    writer = JSONLineWriter(protocol_out)
+    writer.write(runtime.ready_message())
+    if preload_model:
+        runtime.preload_model(background=True)
+    serve_stream(runtime, sys.stdin, writer)
+
+    # Drain queued requests before exiting so no response is lost
+    runtime.executor.shutdown(wait=True)
+
+
+def _make_handler(runtime: NLUWorkerRuntime, on_shutdown: Callable[[socketserver.BaseServer], None]):
+    """Build a socket handler serving one JSON-lines session per connection"""
+
+    class _Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            reader = (line.decode("utf-8", errors="replace") for line in self.rfile)
+            writer = JSONLineWriter(_SocketTextStream(self.wfile))
+            writer.write(runtime.ready_message())
+            if serve_stream(runtime, reader, writer):
+                on_shutdown(self.server)
+
+    return _Handler
+
+
+class _JSONLineServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def _stop_server(server: socketserver.BaseServer):
+    threading.Thread(target=server.shutdown, daemon=True).start()
+
+
+def serve_unix_socket(runtime: NLUWorkerRuntime, socket_path: str, preload_model: bool = False):
+    """Serve requests on a Unix domain socket, one JSON-lines session per connection"""
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+
+    with _JSONLineServer(socket_path, _make_handler(runtime, _stop_server)) as server:
+        print(f"🔌 NLU worker listening on {socket_path}", file=sys.stderr)
+        if preload_model:
+            runtime.preload_model(background=True)
+        try:
+            server.serve_forever()
+        finally:
+            runtime.executor.shutdown(wait=True)
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+
+
+def read_memory_usage(pid: Any = "self") -> Dict[str, Any]:
+    """
+    Read RSS and PSS for a process from /proc/<pid>/smaps_rollup (Linux only).
+
+    RSS counts every resident page, PSS splits shared pages between the
+    processes mapping them - PSS well below RSS means copy-on-write sharing works.
+    """
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+            fields = {}
+            for line in f:
+                key, _, rest = line.partition(":")
+                parts = rest.split()
+                if len(parts) == 2 and parts[1] == "kB":
+                    fields[key.strip()] = int(parts[0])
+    except (OSError, ValueError):
+        return {"status": "unavailable"}
+
+    return {
+        "rss_kb": fields.get("Rss", 0),
+        "pss_kb": fields.get("Pss", 0),
+        "shared_kb": fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0),
+        "private_kb": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+    }
+
+
+def serve_prefork(runtime: NLUWorkerRuntime, socket_path: str, workers: int):
+    """
+    Pre-forked server: load the NLU once, freeze the heap and fork `workers`
+    children that share the spaCy model and pattern tables copy-on-write.
+
+    Every child accepts connections on the same listening socket, opens its own
+    database connection after the fork and reports its RSS/PSS at start-up.
+    Dead children are respawned until the parent receives SIGTERM/SIGINT or a
+    client sends a shutdown request. The spaCy model is always loaded in the
+    parent before forking, since a child that loaded it lazily would hold its
+    own copy.
+    """
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+
+    runtime.preload_model(background=False)
+
+    # Database connections must never be shared across a fork
+    runtime.release_resources()
+
+    listen_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listen_socket.bind(socket_path)
+    listen_socket.listen(128)
+    # Non-blocking so idle children woken for a connection another child took
+    # return to their select loop instead of blocking in accept()
+    listen_socket.setblocking(False)
+
+    # Move everything loaded so far into the permanent generation: the cyclic
+    # GC never touches those objects again, so their pages stay shared.
+    gc.collect()
+    gc.freeze()
+
+    parent_pid = os.getpid()
+    children: Dict[int, int] = {}
+    stopping = False
+
+    def spawn(slot: int):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            exit_code = 0
+            try:
+                _run_prefork_child(runtime, listen_socket, slot, parent_pid)
+            except Exception as e:
+                print(f"❌ NLU worker {slot} crashed: {e}", file=sys.stderr)
+                exit_code = 1
+            finally:
+                os._exit(exit_code)
+        children[pid] = slot
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        # Wake the waitpid() loop below by stopping the children
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for slot in range(workers):
+        spawn(slot)
+    print(f"🔌 NLU prefork server listening on {socket_path} with {workers} workers", file=sys.stderr)
+
+    try:
+        while not stopping:
+            try:
+                pid, _ = os.waitpid(-1, 0)
+            except InterruptedError:
+                continue
+            except ChildProcessError:
+                break
+            slot = children.pop(pid, None)
+            if slot is not None and not stopping:
+                print(f"⚠️  NLU worker {slot} (pid {pid}) exited - respawning", file=sys.stderr)
+                spawn(slot)
+    finally:
+        stop(signal.SIGTERM, None)
+        for pid in list(children):
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        listen_socket.close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+def _run_prefork_child(runtime: NLUWorkerRuntime, listen_socket: socket.socket, slot: int, parent_pid: int):
+    """Body of a pre-forked worker process"""
+    runtime.after_fork(slot)
+
+    print(json.dumps({"type": "worker_memory", "worker": slot, **runtime.memory_report}), file=sys.stderr)
+
+    def request_pool_shutdown(server: socketserver.BaseServer):
+        # A shutdown request stops the whole pool, not just this child
+        os.kill(parent_pid, signal.SIGTERM)
+
+    server = _JSONLineServer(listen_socket.getsockname(), _make_handler(runtime, request_pool_shutdown),
+                             bind_and_activate=False)
+    server.socket.close()
+    server.socket = listen_socket
+    try:
+        server.serve_forever()
+    finally:
+        runtime.executor.shutdown(wait=False)
+
+
+class _SocketTextStream:
+    """Minimal text adapter over a socket's binary write file"""
+
+    def __init__(self, wfile):
+        self.wfile = wfile
+
+    def write(self, text: str):
+        self.wfile.write(text.encode("utf-8"))
+
+    def flush(self):
+        self.wfile.flush()
+
+
+def main():
+    """Command line entry point for the persistent NLU worker"""
+    parser = argparse.ArgumentParser(description="RevivaTech persistent NLU worker")
+    parser.add_argument("--service", choices=sorted(SERVICES), default="phase3",
+                        help="NLU service to load (default: phase3)")
+    parser.add_argument("--socket", dest="socket_path", default=None,
+                        help="Serve on this Unix socket instead of stdin/stdout")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Pre-fork this many worker processes sharing one loaded model (requires --socket)")
+    parser.add_argument("--preload-model", action="store_true",
+                        help="Load the spaCy model in the background right after ready instead of "
+                             "on first use (pre-forked workers always share a model loaded up front)")
+    args = parser.parse_args()
+
+    if args.workers > 1 and not args.socket_path:
+        parser.error("--workers requires --socket")
+
+    # Keep the real stdout for the protocol; service start-up banners and
+    # stray prints go to stderr so they can never corrupt a JSON line.
+    protocol_out = sys.stdout
+    sys.stdout = sys.stderr
+
+    runtime = NLUWorkerRuntime(args.service)
+    try:
+        runtime.load()
+    except Exception as e:
+        JSONLineWriter(protocol_out).write({
+            "type": "error",
+            "status": "initialization_error",
+            "error": str(e),
+            "service": args.service,
+            "timestamp": datetime.now().isoformat()
+        })
+        sys.exit(1)
+
+    if args.workers > 1:
+        serve_prefork(runtime, args.socket_path, args.workers)
+    elif args.socket_path:
+        serve_unix_socket(runtime, args.socket_path, args.preload_model)
+    else:
+        serve_stdio(runtime, protocol_out, args.preload_model)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+RevivaTech Pattern Automaton
+Aho-Corasick multi-pattern matcher used by the NLU pattern dictionaries.
+
+One pass over the text reports every keyword occurrence, instead of running
+`pattern in text` once per dictionary entry. The C implementation from
+pyahocorasick is used when it is installed; otherwise a pure-Python automaton
+with the same behaviour is built.
+
+TokenTrie is the token-level counterpart for short aliases ("mi", "hp") that
+must only match whole tokens.
+"""
+
+import re
+from typing import Any, Dict, Iterator, List, Tuple
+
+try:
+    import ahocorasick
+except ImportError:  # optional C accelerator
+    ahocorasick = None
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton over lowercase keywords.
+
+    word_boundaries controls which keyword edges must not be glued to other
+    letters/digits:
+    - "both":  whole words only ("mi" does not match inside "microphone")
+    - "start": the keyword must start a word but may be followed by a suffix
+               ("battery drain" still matches "battery drains")
+    - "none":  plain substring matching, same as `keyword in text`
+    Keyword edges that are not alphanumeric (e.g. the "+" in "1+") are never checked.
+    """
+
+    BOUNDARY_MODES = ("both", "start", "none")
+
+    def __init__(self, word_boundaries: str = "both"):
+        if word_boundaries not in self.BOUNDARY_MODES:
+            raise ValueError(f"word_boundaries must be one of {self.BOUNDARY_MODES}")
+        self.word_boundaries = word_boundaries
+        self._keywords: Dict[str, Any] = {}
+        self._built = False
+
+        # Pure-Python automaton state (node 0 is the root)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[str]] = [[]]
+
+        self._native = None
+
+    def __len__(self) -> int:
+        return len(self._keywords)
+
+    def add(self, keyword: str, value: Any = None):
+        """Register a keyword (re-adding a keyword replaces its value)"""
+        if not keyword:
+            return
+        self._keywords[keyword] = value
+        self._built = False
+
+    def build(self) -> "KeywordAutomaton":
+        """Compile the automaton; called automatically on first search"""
+        if ahocorasick is not None:
+            self._native = ahocorasick.Automaton()
+            for keyword in self._keywords:
+                self._native.add_word(keyword, keyword)
+            if self._keywords:
+                self._native.make_automaton()
+        else:
+            self._build_python()
+        self._built = True
+        return self
+
+    def _build_python(self):
+        goto: List[Dict[str, int]] = [{}]
+        output: List[List[str]] = [[]]
+
+        for keyword in self._keywords:
+            node = 0
+            for char in keyword:
+                next_node = goto[node].get(char)
+                if next_node is None:
+                    next_node = len(goto)
+                    goto[node][char] = next_node
+                    goto.append({})
+                    output.append([])
+                node = next_node
+            output[node].append(keyword)
+
+        # Breadth-first construction of failure links
+        fail = [0] * len(goto)
+        queue = list(goto[0].values())
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            for char, child in goto[node].items():
+                queue.append(child)
+                state = fail[node]
+                while state and char not in goto[state]:
+                    state = fail[state]
+                fallback = goto[state].get(char, 0)
+                fail[child] = fallback if fallback != child else 0
+                output[child] = output[child] + output[fail[child]]
+
+        self._goto, self._fail, self._output = goto, fail, output
+
+    def _raw_matches(self, text: str) -> Iterator[Tuple[int, str]]:
+        """Yield (end_index, keyword) for every occurrence, end index inclusive"""
+        if self._native is not None:
+            if len(self._keywords):
+                yield from self._native.iter(text)
+            return
+
+        goto, fail, output = self._goto, self._fail, self._output
+        node = 0
+        for index, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for keyword in output[node]:
+                yield index, keyword
+
+    def _on_boundary(self, text: str, start: int, end: int, keyword: str) -> bool:
+        if keyword[0].isalnum() and start > 0 and text[start - 1].isalnum():
+            return False
+        if self.word_boundaries == "both" and keyword[-1].isalnum() \
+                and end + 1 < len(text) and text[end + 1].isalnum():
+            return False
+        return True
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int, str, Any]]:
+        """Yield (start, end_exclusive, keyword, value) for every occurrence in text"""
+        if not self._built:
+            self.build()
+
+        for end, keyword in self._raw_matches(text):
+            start = end - len(keyword) + 1
+            if self.word_boundaries != "none" and not self._on_boundary(text, start, end, keyword):
+                continue
+            yield start, end + 1, keyword, self._keywords[keyword]
+
+    def find_keywords(self, text: str) -> Dict[str, Any]:
+        """Distinct keywords found in text, mapped to their values (first-seen order)"""
+        found: Dict[str, Any] = {}
+        for _, _, keyword, value in self.iter_matches(text):
+            if keyword not in found:
+                found[keyword] = value
+        return found
+
+
+class TokenTrie:
+    """
+    Trie over token sequences, matched on token boundaries in a single pass.
+
+    Text is split into runs of letters, runs of digits and "+" signs, so
+    "iphone11" yields "iphone" + "11", "1+" yields "1" + "+", and "mi" never
+    matches inside "microphone". Multi-word phrases ("one plus") match across
+    any non-token separators.
+    """
+
+    TOKEN_PATTERN = re.compile(r"[a-z]+|[0-9]+|\+")
+    _END = object()
+
+    def __init__(self):
+        self._root: Dict[Any, Any] = {}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @classmethod
+    def tokenize(cls, text: str) -> List[Tuple[str, int, int]]:
+        """(token, start, end_exclusive) for every token of the lowercased text"""
+        return [(m.group(), m.start(), m.end()) for m in cls.TOKEN_PATTERN.finditer(text.lower())]
+
+    def add(self, phrase: str, value: Any = None):
+        """Register a phrase (re-adding a phrase replaces its value)"""
+        tokens = [token for token, _, _ in self.tokenize(phrase)]
+        if not tokens:
+            return
+        node = self._root
+        for token in tokens:
+            node = node.setdefault(token, {})
+        if self._END not in node:
+            self._size += 1
+        node[self._END] = (phrase, value)
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int, str, Any]]:
+        """Yield (start, end_exclusive, phrase, value) for every phrase occurrence, in text order"""
+        tokens = self.tokenize(text)
+        for first in range(len(tokens)):
+            node = self._root
+            for index in range(first, len(tokens)):
+                node = node.get(tokens[index][0])
+                if node is None:
+                    break
+                if self._END in node:
+                    phrase, value = node[self._END]
+                    yield tokens[first][1], tokens[index][2], phrase, value
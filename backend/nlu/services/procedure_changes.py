@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+RevivaTech Procedure Changes
+LISTEN for the repair procedure change notifications of migration 008.
+
+The knowledge base caches search results (matched procedure rows and their
+steps/feedback details) by search criteria, so a repeated search makes no
+query; searching and ranking themselves stay in Postgres. Migration 008
+NOTIFYs repair_procedures_changed with the id of every procedure whose row,
+steps or feedback change. ProcedureChangeListener LISTENs on a background
+thread and calls on_change for every batch of notifications, so cached
+results are dropped moments after the change commits. While the listener is
+not connected a change could be missed, so it reports itself not listening
+and callers bypass their cache.
+"""
+
+import os
+import time
+import select
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional, Set
+
+import psycopg2
+
+logger = logging.getLogger(__name__)
+
+# Must match the channel migration 008 notifies
+CHANNEL = "repair_procedures_changed"
+
+
+class ProcedureChangeListener:
+    """
+    Calls on_change(ids) from a background thread whenever procedures change.
+
+    ids is the set of changed procedure ids, or None when anything may have
+    changed: a TRUNCATE, and every (re)connect, since notifications sent
+    while the listener was not connected are lost.
+    """
+
+    def __init__(
+        self,
+        connect_kwargs: Dict[str, Any],
+        on_change: Callable[[Optional[Set[int]]], None],
+        channel: str = CHANNEL,
+        poll_interval: float = 5.0,
+        retry_delay: float = 5.0
+    ):
+        self.connect_kwargs = dict(connect_kwargs)
+        self.on_change = on_change
+        self.channel = channel
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+
+        self._listening = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+        self.stats = {
+            "connects": 0,
+            "notifications": 0,
+            "changes": 0,
+            "listener_errors": 0,
+            "last_change_at": None
+        }
+
+    def start(self):
+        """Start the listener thread (listening once it has subscribed)"""
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        self._stop.clear()
+        self._listening.clear()
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._listen, name="procedure-changes", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._listening.clear()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout)
+        self._thread = None
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        return self._listening.wait(timeout)
+
+    @property
+    def listening(self) -> bool:
+        """Whether every change from now on will be reported"""
+        if self._pid is not None and self._pid != os.getpid():
+            # Forked: the listener thread did not come along
+            self.start()
+        return self._listening.is_set()
+
+    def _listen(self):
+        while not self._stop.is_set():
+            connection = None
+            try:
+                connection = psycopg2.connect(**self.connect_kwargs)
+                connection.autocommit = True
+                with connection.cursor() as cursor:
+                    cursor.execute(f"LISTEN {self.channel}")
+                    self.stats["connects"] += 1
+                    # Subscribed now; anything before this may have been missed
+                    self._changed(None)
+                    self._listening.set()
+                    while not self._stop.is_set():
+                        if not select.select([connection], [], [], self.poll_interval)[0]:
+                            # Quiet channel: make sure the connection is still alive
+                            cursor.execute("SELECT 1")
+                        connection.poll()
+                        self._apply_notifications(connection)
+            except Exception as e:
+                self._listening.clear()
+                self.stats["listener_errors"] += 1
+                logger.error(f"❌ Procedure change listener failed: {e}")
+                self._stop.wait(self.retry_delay)
+            finally:
+                if connection is not None:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass
+
+    def _apply_notifications(self, connection):
+        changed: Set[int] = set()
+        everything = False
+        while connection.notifies:
+            payload = connection.notifies.pop(0).payload
+            self.stats["notifications"] += 1
+            if payload.isdigit():
+                changed.add(int(payload))
+            else:
+                everything = True
+        if everything:
+            self._changed(None)
+        elif changed:
+            self._changed(changed)
+
+    def _changed(self, procedure_ids: Optional[Set[int]]):
+        self.stats["changes"] += 1
+        self.stats["last_change_at"] = time.time()
+        self.on_change(procedure_ids)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "listening": self._listening.is_set()}
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+RevivaTech Shared Cache
+SQLite-backed cache shared by every NLU worker process on a host.
+
+The in-process TTLCache starts cold in every worker (and after every restart),
+so an expensive user agent parse done by one worker is repeated by all the
+others. SQLiteCache keeps entries in a local SQLite file in WAL mode: readers
+never block the writer, every process sees the same entries, and they survive
+restarts until their TTL runs out. The file is kept under max_bytes by
+evicting expired entries first and then the oldest ones.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import Any, Callable, Optional
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_entries (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_cache_entries_expires_at ON cache_entries (expires_at);
+"""
+
+
+class SQLiteCache:
+    """
+    Dict-like cache (get / [] / in / clear) over a shared SQLite file.
+
+    Values go through dumps/loads (JSON by default), so a get always returns a
+    new object. Each process opens its own connection on first use, which
+    keeps the cache safe to create before a prefork.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl: float = 300.0,
+        max_bytes: int = 64 * 1024 * 1024,
+        dumps: Callable[[Any], str] = json.dumps,
+        loads: Callable[[str], Any] = json.loads,
+        prune_interval: int = 64
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.dumps = dumps
+        self.loads = loads
+        self.prune_interval = prune_interval
+
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._connection_pid: Optional[int] = None
+        self._writes_since_prune = 0
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expirations": 0, "errors": 0}
+
+    def _connect(self) -> sqlite3.Connection:
+        """Connection for the current process (re-opened after a fork)"""
+        if self._connection is None or self._connection_pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(_SCHEMA)
+            self._connection = connection
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Cached value for key, or default if it is missing or expired"""
+        try:
+            with self._lock:
+                row = self._connect().execute(
+                    "SELECT value FROM cache_entries WHERE key = ? AND expires_at > ?",
+                    (key, time.time())
+                ).fetchone()
+        except sqlite3.Error:
+            self.stats["errors"] += 1
+            return default
+
+        if row is None:
+            self.stats["misses"] += 1
+            return default
+        self.stats["hits"] += 1
+        return self.loads(row[0])
+
+    def __getitem__(self, key: str) -> Any:
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key: str) -> bool:
+        try:
+            with self._lock:
+                row = self._connect().execute(
+                    "SELECT 1 FROM cache_entries WHERE key = ? AND expires_at > ?",
+                    (key, time.time())
+                ).fetchone()
+        except sqlite3.Error:
+            self.stats["errors"] += 1
+            return False
+        return row is not None
+
+    def __setitem__(self, key: str, value: Any):
+        try:
+            payload = self.dumps(value)
+        except (TypeError, ValueError):
+            self.stats["errors"] += 1
+            return
+        size = len(key) + len(payload.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+
+        try:
+            with self._lock:
+                connection = self._connect()
+                connection.execute(
+                    "INSERT OR REPLACE INTO cache_entries (key, value, size, expires_at) VALUES (?, ?, ?, ?)",
+                    (key, payload, size, time.time() + self.ttl)
+                )
+                self.stats["stores"] += 1
+                self._writes_since_prune += 1
+                if self._writes_since_prune >= self.prune_interval:
+                    self._prune(connection)
+        except sqlite3.Error:
+            self.stats["errors"] += 1
+
+    def _prune(self, connection: sqlite3.Connection):
+        """Drop expired entries, then the oldest ones until the cache is under 90% of max_bytes"""
+        self._writes_since_prune = 0
+        expired = connection.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (time.time(),)).rowcount
+        self.stats["expirations"] += expired
+
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM cache_entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        # Oldest entries expire first, so evict everything up to a cutoff in one statement
+        target = int(self.max_bytes * 0.9)
+        cutoff = None
+        for expires_at, size in connection.execute(
+            "SELECT expires_at, size FROM cache_entries ORDER BY expires_at"
+        ).fetchall():
+            if total <= target:
+                break
+            total -= size
+            cutoff = expires_at
+        if cutoff is not None:
+            evicted = connection.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (cutoff,)).rowcount
+            self.stats["evictions"] += evicted
+
+    def prune(self):
+        """Enforce the TTL and size bound now"""
+        with self._lock:
+            self._prune(self._connect())
+
+    def clear(self):
+        with self._lock:
+            self._connect().execute("DELETE FROM cache_entries")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connect().execute(
+                "SELECT COUNT(*) FROM cache_entries WHERE expires_at > ?", (time.time(),)
+            ).fetchone()[0]
+
+    def get_stats(self) -> dict:
+        """Counters of this process plus the shared file's current entries and bytes"""
+        try:
+            with self._lock:
+                entries, size = self._connect().execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries WHERE expires_at > ?",
+                    (time.time(),)
+                ).fetchone()
+        except sqlite3.Error:
+            self.stats["errors"] += 1
+            entries, size = None, None
+
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl
+        }
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None and self._connection_pid == os.getpid():
+                self._connection.close()
+            self._connection = None
+            self._connection_pid = None
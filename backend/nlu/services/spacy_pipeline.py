@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+RevivaTech spaCy Pipeline Loader
+Loads the spaCy model with only the components the NLU services actually use.
+
+The extractors only need two things from spaCy:
+- tokens, which nlp.make_doc produces without running any component
+- entities, which need the "ner" component only (in the en_core_web_* v3
+  pipelines NER carries its own tok2vec and does not listen to the shared one)
+Excluded components are never loaded, which saves both latency and memory.
+
+LazyPipeline defers loading the model until a message actually needs entities,
+so messages resolved by the dictionary/regex patterns never wait for it.
+"""
+
+import time
+import threading
+from typing import Iterable, Optional, List, Dict, Any
+
+import numpy as np
+import spacy
+
+import nlu_config
+
+# Components of the en_core_web_* v3 pipelines, in pipeline order
+FULL_PIPELINE = ("tok2vec", "tagger", "parser", "attribute_ruler", "lemmatizer", "ner")
+
+
+def resolve_components(components: Optional[Iterable[str]] = None) -> Optional[List[str]]:
+    """Return the enabled component list, or None for the full pipeline"""
+    if components is None:
+        components = nlu_config.SPACY_COMPONENTS
+    components = list(components)
+    if not components or "all" in components:
+        return None
+    return components
+
+
+def load_pipeline(model_name: Optional[str] = None, components: Optional[Iterable[str]] = None):
+    """
+    Load a spaCy model with a restricted set of components.
+
+    Args:
+        model_name: spaCy package name (defaults to NLU_SPACY_MODEL)
+        components: Components to keep (defaults to NLU_SPACY_COMPONENTS,
+            "all" keeps the full pipeline)
+    """
+    model_name = model_name or nlu_config.SPACY_MODEL
+    enabled = resolve_components(components)
+
+    if enabled is None:
+        return spacy.load(model_name)
+
+    exclude = [component for component in FULL_PIPELINE if component not in enabled]
+    return spacy.load(model_name, exclude=exclude)
+
+
+class LazyPipeline:
+    """
+    spaCy pipeline that is loaded on first use (or in a background thread).
+
+    Calling it, piping texts or accessing `.model` loads the model. make_doc
+    never forces a load: until the model is in memory it tokenizes with a blank
+    English pipeline, which uses the same tokenizer rules as en_core_web_*.
+    """
+
+    def __init__(self, model_name: Optional[str] = None, components: Optional[Iterable[str]] = None):
+        self.model_name = model_name or nlu_config.SPACY_MODEL
+        self.components = resolve_components(components)
+        self._nlp = None
+        self._tokenizer_nlp = None
+        self._lock = threading.Lock()
+        self._loader_thread: Optional[threading.Thread] = None
+        self.load_time_ms = 0.0
+        self.parse_count = 0
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._nlp is not None
+
+    @property
+    def model(self):
+        """The loaded spaCy Language object (loads it if necessary)"""
+        if self._nlp is None:
+            with self._lock:
+                if self._nlp is None:
+                    start_time = time.time()
+                    self._nlp = load_pipeline(self.model_name, self.components or ["all"])
+                    self.load_time_ms = (time.time() - start_time) * 1000
+        return self._nlp
+
+    def load_in_background(self) -> threading.Thread:
+        """Start loading the model in a daemon thread; returns the thread"""
+        if self._loader_thread is None and not self.is_loaded:
+            self._loader_thread = threading.Thread(
+                target=lambda: self.model, name="spacy-preload", daemon=True
+            )
+            self._loader_thread.start()
+        return self._loader_thread
+
+    def __call__(self, text: str):
+        self.parse_count += 1
+        return self.model(text)
+
+    def pipe(self, texts: Iterable[str], **kwargs):
+        for doc in self.model.pipe(texts, **kwargs):
+            self.parse_count += 1
+            yield doc
+
+    def make_doc(self, text: str):
+        """Tokenize only, without loading the statistical model"""
+        if self._nlp is not None:
+            return self._nlp.make_doc(text)
+        if self._tokenizer_nlp is None:
+            self._tokenizer_nlp = spacy.blank("en")
+        return self._tokenizer_nlp.make_doc(text)
+
+    def vectors(self, texts: List[str]) -> np.ndarray:
+        """(len(texts), dim) document vectors from the model's static word vectors"""
+        return np.vstack([self.model.make_doc(text).vector for text in texts])
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "model": self.model_name,
+            "loaded": self.is_loaded,
+            "load_time_ms": round(self.load_time_ms, 2),
+            "parse_count": self.parse_count
+        }